@@ -374,8 +374,13 @@ class Brick:
         else:
             print("Orientation error: Current orientation is the same!")
 
-    # spawns the brick in the scene
-    def spawn_brick(self, x, y, z, material):
+    # spawns the brick in the scene (a brick catalog variant overrides the orientation, dimensions and rotation)
+    def spawn_brick(self, x, y, z, material, variant=None):
+        if variant is None:
+            orientation, length, width, rotation_angle = self.orientation, self.length, self.width, self.rotation_angle
+        else:
+            orientation, length, width, rotation_angle = variant.orientation, variant.length, variant.width, variant.rotation_angle
+
         # create a brick with a reference if one doesn't exist yet
         if self.brick_reference == None:
             file_path = f"brick_models\\{self.filename}"
@@ -422,32 +427,32 @@ class Brick:
         material.apply_to_object(duplicated_brick)
 
         # set the position and rotation
-        if self.orientation in Orientation:
-            if self.orientation == Orientation.EAST_WEST:
+        if orientation in Orientation:
+            if orientation == Orientation.EAST_WEST:
                 duplicated_brick.location = (x, y, z * 0.4)
-            elif self.orientation == Orientation.NORTH_SOUTH:
-                duplicated_brick.location = (x + self.length, y, z * 0.4)
+            elif orientation == Orientation.NORTH_SOUTH:
+                duplicated_brick.location = (x + length, y, z * 0.4)
             else:
                 duplicated_brick.location = (x, y, z * 0.4)
-        elif self.orientation in SlopedOrientation:
-            if self.orientation == SlopedOrientation.NORTH:
+        elif orientation in SlopedOrientation:
+            if orientation == SlopedOrientation.NORTH:
                 duplicated_brick.location = (x, y, z * 0.4)
-            elif self.orientation == SlopedOrientation.SOUTH:
-                duplicated_brick.location = (x + self.length, y + self.width, z * 0.4)
-            elif self.orientation == SlopedOrientation.EAST:
-                duplicated_brick.location = (x, y + self.width, z * 0.4)
-            elif self.orientation == SlopedOrientation.WEST:
-                duplicated_brick.location = (x + self.length, y, z * 0.4)
+            elif orientation == SlopedOrientation.SOUTH:
+                duplicated_brick.location = (x + length, y + width, z * 0.4)
+            elif orientation == SlopedOrientation.EAST:
+                duplicated_brick.location = (x, y + width, z * 0.4)
+            elif orientation == SlopedOrientation.WEST:
+                duplicated_brick.location = (x + length, y, z * 0.4)
                 
 
         duplicated_brick.rotation_mode = "XYZ"
-        duplicated_brick.rotation_euler = Euler((0, 0, radians(self.rotation_angle)), 'XYZ')
+        duplicated_brick.rotation_euler = Euler((0, 0, radians(rotation_angle)), 'XYZ')
         
         # link the brick to the bricks collection
         bricks_collection = bpy.data.collections.get("Bricks")
         bricks_collection.objects.link(duplicated_brick)
 
-        return Brick(self.length, self.width, self.height, self.filename)
+        return Brick(length, width, self.height, self.filename)
     
     # removes the brick from the scene
     def remove_brick(self):
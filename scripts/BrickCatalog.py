@@ -0,0 +1,123 @@
+import copy
+import numpy as np
+from collections import namedtuple
+from Brick import Orientation, SlopedOrientation
+
+# mirrored orientation of each sloped orientation (on the X axis)
+mirrored_sloped_orientations = {
+    SlopedOrientation.NORTH: SlopedOrientation.SOUTH,
+    SlopedOrientation.SOUTH: SlopedOrientation.NORTH,
+    SlopedOrientation.EAST: SlopedOrientation.WEST,
+    SlopedOrientation.WEST: SlopedOrientation.EAST,
+}
+
+# prioritize the smaller of length/width, then the larger of length/width
+def surface_priority(brick):
+    return (min(brick.length, brick.width), max(brick.length, brick.width))
+
+# prioritize the largest area
+def area_priority(brick):
+    return brick.length * brick.width
+
+# returns the highest kernel voxel of every (x, y) column of the kernel that has one (as x, y and z arrays)
+def kernel_top_profile(kernel):
+    filled_voxels = kernel == 1
+    column_xs, column_ys = np.nonzero(filled_voxels.any(axis=2))
+    column_top_zs = kernel.shape[2] - 1 - np.argmax(filled_voxels[column_xs, column_ys, ::-1], axis=1)
+
+    for column_indices in (column_xs, column_ys, column_top_zs):
+        column_indices.setflags(write=False)
+
+    return column_xs, column_ys, column_top_zs
+
+# a brick in one orientation (read only, the kernel can't be written either)
+class BrickVariant(namedtuple("BrickVariant", ["index", "brick_index", "brick", "orientation", "length", "width", "height",
+                                               "brick_kernel", "kernel_origin", "kernel_sum", "rotation_angle", "top_profile"])):
+    __slots__ = ()
+
+    # spawns the source brick in the orientation of the variant
+    def spawn_brick(self, x, y, z, material):
+        return self.brick.spawn_brick(x, y, z, material, self)
+
+class BrickCatalog:
+    def __init__(self, bricks):
+        self.names = tuple(bricks.keys())
+        self.bricks = tuple(bricks.values()) # source bricks (only used to spawn the brick models)
+        self.priority_orders = {} # brick indices sorted by a priority function (key: priority function)
+        self.variant_indices = [] # variant index of each orientation of a brick (key: orientation)
+        self.variants = self.create_variants()
+
+        # array-backed tables of the variants (same index as the variants)
+        self.brick_indices = np.array([variant.brick_index for variant in self.variants], dtype=np.int32)
+        self.lengths = np.array([variant.length for variant in self.variants], dtype=np.int32)
+        self.widths = np.array([variant.width for variant in self.variants], dtype=np.int32)
+        self.heights = np.array([variant.height for variant in self.variants], dtype=np.int32)
+        self.kernel_origins = np.array([variant.kernel_origin for variant in self.variants], dtype=np.int32).reshape(-1, 3)
+        self.kernel_sums = np.array([variant.kernel_sum for variant in self.variants], dtype=np.int64)
+        self.rotation_angles = np.array([variant.rotation_angle for variant in self.variants], dtype=np.int32)
+
+        for table in (self.brick_indices, self.lengths, self.widths, self.heights, self.kernel_origins, self.kernel_sums, self.rotation_angles):
+            table.setflags(write=False)
+
+    # returns all the orientations a brick can be rotated to (in the enum order)
+    def brick_orientations(self, brick):
+        if isinstance(brick.orientation, SlopedOrientation):
+            return list(SlopedOrientation)
+        elif brick.orientation == Orientation.NONE:
+            return [Orientation.NONE]
+
+        return [Orientation.EAST_WEST, Orientation.NORTH_SOUTH]
+
+    # rotates a copy of every brick to all of its orientations and saves the results as variants
+    def create_variants(self):
+        variants = []
+
+        for brick_index, brick in enumerate(self.bricks):
+            orientation_indices = {}
+
+            for orientation in self.brick_orientations(brick):
+                # rotate a copy so the source brick keeps its orientation
+                oriented_brick = copy.copy(brick)
+
+                if orientation != brick.orientation:
+                    if isinstance(orientation, SlopedOrientation):
+                        oriented_brick.change_sloped_orientation(orientation)
+                    else:
+                        oriented_brick.change_orientation(orientation)
+
+                kernel = np.array(oriented_brick.brick_kernel)
+                kernel.setflags(write=False)
+
+                orientation_indices[orientation] = len(variants)
+                variants.append(BrickVariant(len(variants), brick_index, brick, orientation, oriented_brick.length, oriented_brick.width,
+                                             oriented_brick.height, kernel, tuple(oriented_brick.kernel_origin), int(kernel.sum()),
+                                             oriented_brick.rotation_angle, kernel_top_profile(kernel)))
+
+            self.variant_indices.append(orientation_indices)
+
+        return tuple(variants)
+
+    # returns the brick indices from the highest to the lowest priority (ties keep the order of the dictionary)
+    def ordered_bricks(self, priority=surface_priority):
+        if priority not in self.priority_orders:
+            self.priority_orders[priority] = tuple(sorted(range(len(self.bricks)), key=lambda brick_index: priority(self.bricks[brick_index]), reverse=True))
+
+        return self.priority_orders[priority]
+
+    # returns the variant of a brick in the orientation
+    def variant(self, brick_index, orientation):
+        return self.variants[self.variant_indices[brick_index][orientation]]
+
+    # returns the variants of a brick starting with the default orientation (the other ones follow in the enum order)
+    def orientation_variants(self, brick_index, default_orientation):
+        orientation_indices = self.variant_indices[brick_index]
+        orientations = sorted(orientation_indices, key=lambda orientation: orientation != default_orientation)
+
+        return [self.variants[orientation_indices[orientation]] for orientation in orientations]
+
+    # returns the variant of the same brick mirrored on the X axis (only sloped bricks change the orientation)
+    def mirrored_variant(self, variant):
+        if isinstance(variant.orientation, SlopedOrientation):
+            return self.variant(variant.brick_index, mirrored_sloped_orientations[variant.orientation])
+
+        return variant
@@ -0,0 +1,290 @@
+import itertools
+import numpy as np
+
+# edge length of the chunks (in voxels)
+chunk_size = 16
+
+# grid stored in cubic chunks that are only allocated where the grid has non-zero voxels (most of a big model grid is empty)
+# it is indexed like the dense grid: boxes of slices and single voxels return numpy values, index arrays gather single voxels
+class ChunkedGrid:
+    def __init__(self, shape, dtype, chunk_size=chunk_size):
+        self.shape = tuple(int(axis_size) for axis_size in shape)
+        self.dtype = np.dtype(dtype)
+        self.ndim = 3
+        self.chunk_size = chunk_size
+        self.chunk_grid_shape = tuple(-(-axis_size // chunk_size) for axis_size in self.shape)
+        self.chunks = {} # allocated chunks (key: chunk index, value: chunk voxels, the chunks on the upper border are smaller)
+        self.occupancy = np.zeros(self.chunk_grid_shape, dtype=np.int32) # number of non-zero voxels of every chunk
+
+    # returns the grid with the voxels of the dense grid (only the chunks with non-zero voxels are allocated)
+    @classmethod
+    def from_dense(cls, grid, chunk_size=chunk_size):
+        chunked_grid = cls(grid.shape, grid.dtype, chunk_size)
+        chunked_grid[:, :, :] = grid
+
+        return chunked_grid
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    # number of bytes of the allocated chunks and the occupancy counts
+    @property
+    def nbytes(self):
+        return sum(chunk.nbytes for chunk in self.chunks.values()) + self.occupancy.nbytes
+
+    # returns the whole grid as a dense array (with the Z layers contiguous in memory)
+    def to_dense(self, dtype=None):
+        dense_grid = np.zeros(self.shape, dtype=self.dtype if dtype is None else dtype, order='F')
+
+        for chunk_index, chunk in self.chunks.items():
+            dense_grid[self.chunk_slices(chunk_index)] = chunk
+
+        return dense_grid
+
+    def __array__(self, dtype=None, copy=None):
+        return self.to_dense(dtype)
+
+    # comparisons are done on the dense grid (same results as comparing the dense grid)
+    def __eq__(self, other):
+        return self.to_dense() == other
+
+    def __ne__(self, other):
+        return self.to_dense() != other
+
+    __hash__ = None
+
+    # returns a copy of the grid converted to the type
+    def astype(self, dtype):
+        converted_grid = ChunkedGrid(self.shape, dtype, self.chunk_size)
+        converted_grid.chunks = {chunk_index: chunk.astype(dtype) for chunk_index, chunk in self.chunks.items()}
+        converted_grid.occupancy = self.occupancy.copy()
+
+        return converted_grid
+
+    def copy(self):
+        return self.astype(self.dtype)
+
+    # returns a copy of the grid with empty layers added on top
+    def extend_layers(self, layer_count):
+        extended_grid = ChunkedGrid((self.shape[0], self.shape[1], self.shape[2] + layer_count), self.dtype, self.chunk_size)
+
+        for chunk_index, chunk in self.chunks.items():
+            extended_grid[self.chunk_slices(chunk_index)] = chunk
+
+        return extended_grid
+
+    # yields the index and the values of every chunk with non-zero voxels (the occupancy counts skip the empty chunks)
+    def occupied_chunks(self):
+        for chunk_index, chunk in self.chunks.items():
+            if self.occupancy[chunk_index] > 0:
+                yield chunk_index, chunk
+
+    # returns the mask of the voxels whose values pass the test (a function of a value array), only the occupied chunks are
+    # tested (the voxels of the other chunks are zeros)
+    def voxel_mask(self, test):
+        mask = np.full(self.shape, bool(test(np.zeros(1, dtype=self.dtype))[0]), order='F')
+
+        for chunk_index, chunk in self.occupied_chunks():
+            mask[self.chunk_slices(chunk_index)] = test(chunk)
+
+        return mask
+
+    # returns the indices of the voxels whose values pass the test in the order of np.argwhere (the test has to fail for zeros,
+    # only the occupied chunks are searched)
+    def voxel_indices(self, test):
+        chunk_indices = [np.argwhere(test(chunk)) + [axis_slice.start for axis_slice in self.chunk_slices(chunk_index)]
+                         for chunk_index, chunk in self.occupied_chunks()]
+
+        if not chunk_indices:
+            return np.zeros((0, 3), dtype=np.int64)
+
+        indices = np.concatenate(chunk_indices)
+
+        return indices[np.lexsort(indices.T[::-1])]
+
+    # yields (lower values, upper values) blocks of the voxels and their next voxel along the axis, the blocks hold every
+    # pair of neighbouring voxels that are both non-zero (inside of the occupied chunks and across their upper sides)
+    def neighbour_blocks(self, axis):
+        for chunk_index, chunk in self.occupied_chunks():
+            chunk_values = np.moveaxis(chunk, axis, 0)
+            yield chunk_values[:-1], chunk_values[1:]
+
+            next_chunk_index = list(chunk_index)
+            next_chunk_index[axis] += 1
+            next_chunk_index = tuple(next_chunk_index)
+
+            if next_chunk_index[axis] < self.chunk_grid_shape[axis] and self.occupancy[next_chunk_index] > 0:
+                yield chunk_values[-1:], np.moveaxis(self.chunks[next_chunk_index], axis, 0)[:1]
+
+    # returns the (X, Y, Z) slices of the chunk in the grid
+    def chunk_slices(self, chunk_index):
+        return tuple(slice(index * self.chunk_size, min((index + 1) * self.chunk_size, axis_size))
+                     for index, axis_size in zip(chunk_index, self.shape))
+
+    # allocates an empty chunk
+    def allocate_chunk(self, chunk_index):
+        chunk_shape = tuple(axis_slice.stop - axis_slice.start for axis_slice in self.chunk_slices(chunk_index))
+        chunk = np.zeros(chunk_shape, dtype=self.dtype, order='F')
+        self.chunks[chunk_index] = chunk
+
+        return chunk
+
+    # recounts the non-zero voxels of the chunk and frees it if there are none left
+    def update_occupancy(self, chunk_index):
+        occupied_voxels = np.count_nonzero(self.chunks[chunk_index])
+        self.occupancy[chunk_index] = occupied_voxels
+
+        if occupied_voxels == 0:
+            del self.chunks[chunk_index]
+
+    # returns the (start, stop) range of the box along every axis and the axes that were indexed with a single integer
+    def box_ranges(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        key = key + (slice(None),) * (3 - len(key))
+        ranges = []
+        integer_axes = []
+
+        for axis, index in enumerate(key):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(self.shape[axis])
+
+                if step != 1:
+                    raise IndexError("ChunkedGrid only supports slices with a step of 1")
+
+                ranges.append((start, max(stop, start)))
+            else:
+                index = int(index) + (self.shape[axis] if index < 0 else 0)
+
+                if not 0 <= index < self.shape[axis]:
+                    raise IndexError(f"index {index} is out of bounds for axis {axis} with size {self.shape[axis]}")
+
+                ranges.append((index, index + 1))
+                integer_axes.append(axis)
+
+        return ranges, integer_axes
+
+    # yields the chunk index, the slices in the chunk and the slices in the box of every chunk that overlaps the box
+    def box_chunks(self, ranges, allocated_only):
+        chunk_ranges = [(start // self.chunk_size, -(-stop // self.chunk_size)) for start, stop in ranges]
+
+        if allocated_only:
+            box_occupancy = self.occupancy[tuple(slice(start, stop) for start, stop in chunk_ranges)]
+            chunk_indices = [tuple(int(index) for index in chunk_index) for chunk_index in np.argwhere(box_occupancy > 0) + [start for start, _ in chunk_ranges]]
+        else:
+            chunk_indices = itertools.product(*(range(start, stop) for start, stop in chunk_ranges))
+
+        for chunk_index in chunk_indices:
+            chunk_slices = []
+            box_slices = []
+
+            for index, (start, stop) in zip(chunk_index, ranges):
+                lower = max(start, index * self.chunk_size)
+                upper = min(stop, (index + 1) * self.chunk_size)
+                chunk_slices.append(slice(lower - index * self.chunk_size, upper - index * self.chunk_size))
+                box_slices.append(slice(lower - start, upper - start))
+
+            yield chunk_index, tuple(chunk_slices), tuple(box_slices)
+
+    # returns the chunk indices and the indices inside of the chunks of the voxels given by the index arrays
+    def voxel_chunks(self, key):
+        indices = np.broadcast_arrays(*(np.asarray(index, dtype=np.int64) for index in key))
+        indices = [np.where(index < 0, index + axis_size, index) for index, axis_size in zip(indices, self.shape)]
+
+        for axis, (index, axis_size) in enumerate(zip(indices, self.shape)):
+            if np.any((index < 0) | (index >= axis_size)):
+                raise IndexError(f"index is out of bounds for axis {axis} with size {axis_size}")
+
+        chunk_ids = np.ravel_multi_index(tuple(index // self.chunk_size for index in indices), self.chunk_grid_shape)
+
+        return chunk_ids, tuple(index % self.chunk_size for index in indices)
+
+    # returns the value of a single voxel
+    def voxel(self, x, y, z):
+        index = []
+
+        for axis, axis_index in enumerate((x, y, z)):
+            axis_index = int(axis_index) + (self.shape[axis] if axis_index < 0 else 0)
+
+            if not 0 <= axis_index < self.shape[axis]:
+                raise IndexError(f"index {axis_index} is out of bounds for axis {axis} with size {self.shape[axis]}")
+
+            index.append(axis_index)
+
+        chunk = self.chunks.get((index[0] // self.chunk_size, index[1] // self.chunk_size, index[2] // self.chunk_size))
+
+        if chunk is None:
+            return self.dtype.type(0)
+
+        return chunk[index[0] % self.chunk_size, index[1] % self.chunk_size, index[2] % self.chunk_size]
+
+    # returns whether the key indexes single voxels with index arrays
+    @staticmethod
+    def is_voxel_key(key):
+        return isinstance(key, tuple) and len(key) == 3 and any(np.ndim(index) > 0 for index in key)
+
+    def __getitem__(self, key):
+        # single voxels are read straight from their chunk (the most common access)
+        if isinstance(key, tuple) and len(key) == 3 and all(isinstance(index, (int, np.integer)) for index in key):
+            return self.voxel(*key)
+
+        if ChunkedGrid.is_voxel_key(key):
+            chunk_ids, local_indices = self.voxel_chunks(key)
+            values = np.zeros(chunk_ids.shape, dtype=self.dtype)
+
+            for chunk_id in np.unique(chunk_ids[self.occupancy.ravel()[chunk_ids] > 0]):
+                selected = chunk_ids == chunk_id
+                chunk = self.chunks[tuple(int(index) for index in np.unravel_index(chunk_id, self.chunk_grid_shape))]
+                values[selected] = chunk[tuple(index[selected] for index in local_indices)]
+
+            return values
+
+        ranges, integer_axes = self.box_ranges(key)
+        box = np.zeros(tuple(stop - start for start, stop in ranges), dtype=self.dtype, order='F')
+
+        for chunk_index, chunk_slices, box_slices in self.box_chunks(ranges, True):
+            box[box_slices] = self.chunks[chunk_index][chunk_slices]
+
+        # single integer indices drop their axis (single voxels are returned as numpy scalars)
+        return box[tuple(0 if axis in integer_axes else slice(None) for axis in range(3))]
+
+    def __setitem__(self, key, value):
+        if ChunkedGrid.is_voxel_key(key):
+            chunk_ids, local_indices = self.voxel_chunks(key)
+            values = np.broadcast_to(np.asarray(value, dtype=self.dtype), chunk_ids.shape)
+
+            for chunk_id in np.unique(chunk_ids):
+                selected = chunk_ids == chunk_id
+                chunk_index = tuple(int(index) for index in np.unravel_index(chunk_id, self.chunk_grid_shape))
+                chunk = self.chunks.get(chunk_index)
+
+                # zeros don't need a chunk
+                if chunk is None:
+                    if not values[selected].any():
+                        continue
+
+                    chunk = self.allocate_chunk(chunk_index)
+
+                chunk[tuple(index[selected] for index in local_indices)] = values[selected]
+                self.update_occupancy(chunk_index)
+
+            return
+
+        ranges, integer_axes = self.box_ranges(key)
+        box_shape = tuple(stop - start for start, stop in ranges)
+        indexed_shape = tuple(axis_size for axis, axis_size in enumerate(box_shape) if axis not in integer_axes)
+        box = np.broadcast_to(np.asarray(value, dtype=self.dtype), indexed_shape).reshape(box_shape)
+
+        for chunk_index, chunk_slices, box_slices in self.box_chunks(ranges, False):
+            chunk = self.chunks.get(chunk_index)
+
+            if chunk is None:
+                if not box[box_slices].any():
+                    continue
+
+                chunk = self.allocate_chunk(chunk_index)
+
+            chunk[chunk_slices] = box[box_slices]
+            self.update_occupancy(chunk_index)
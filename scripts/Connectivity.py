@@ -0,0 +1,145 @@
+import numpy as np
+from ChunkedGrid import ChunkedGrid
+
+# returns the unique (lower id, higher id) pairs of different bricks touching each other along any of the axes
+# (only the pairs that contain at least one of the selected bricks if selected_ids is set)
+def touching_brick_pairs(used_bricks_grid, axes, selected_ids=None):
+    pairs = []
+
+    for axis in axes:
+        # compare the grid with its copy shifted by one voxel along the axis (a chunked grid is compared chunk by chunk)
+        if isinstance(used_bricks_grid, ChunkedGrid):
+            neighbour_blocks = used_bricks_grid.neighbour_blocks(axis)
+        else:
+            axis_ids = np.moveaxis(np.asarray(used_bricks_grid), axis, 0)
+            neighbour_blocks = [(axis_ids[:-1], axis_ids[1:])]
+
+        for lower_ids, upper_ids in neighbour_blocks:
+            touching = (lower_ids != 0) & (upper_ids != 0) & (lower_ids != upper_ids)
+
+            if selected_ids is not None:
+                touching &= np.isin(lower_ids, selected_ids) | np.isin(upper_ids, selected_ids)
+
+            first_ids = lower_ids[touching]
+            second_ids = upper_ids[touching]
+            pairs.append(np.stack((np.minimum(first_ids, second_ids), np.maximum(first_ids, second_ids)), axis=1))
+
+    if not pairs:
+        return np.zeros((0, 2), dtype=used_bricks_grid.dtype)
+
+    return np.unique(np.concatenate(pairs).reshape(-1, 2), axis=0)
+
+# returns the stud connections (bricks touching on the Z axis) and the side neighbours (X or Y axis) as unique id pairs
+def brick_adjacency_pairs(used_bricks_grid, selected_ids=None):
+    connected_pairs = touching_brick_pairs(used_bricks_grid, (2,), selected_ids)
+    neighbouring_pairs = touching_brick_pairs(used_bricks_grid, (0, 1), selected_ids)
+
+    return connected_pairs, neighbouring_pairs
+
+# union-find of the stud connections between the bricks (updated while the bricks are placed and removed)
+class ConnectivityTracker:
+    def __init__(self):
+        self.parents = {} # union-find parent of every brick (key: id)
+        self.connections = {} # stud connections of every brick (key: id, value: set of connected ids)
+        self.brick_order = {} # placement order of every brick (key: id)
+        self.members = {} # bricks of every component (key: root id, value: set of ids)
+        self.first_bricks = {} # placement order of the first brick of every component (key: root id)
+        self.placed_bricks = 0
+
+    # adds a brick as its own component
+    def add_brick(self, brick_id):
+        if brick_id in self.parents:
+            return
+
+        self.parents[brick_id] = brick_id
+        self.connections[brick_id] = set()
+        self.brick_order[brick_id] = self.placed_bricks
+        self.members[brick_id] = {brick_id}
+        self.first_bricks[brick_id] = self.placed_bricks
+        self.placed_bricks += 1
+
+    # returns the root id of the brick's component
+    def find(self, brick_id):
+        root_id = brick_id
+
+        while self.parents[root_id] != root_id:
+            root_id = self.parents[root_id]
+
+        # point the whole path at the root
+        while self.parents[brick_id] != root_id:
+            self.parents[brick_id], brick_id = root_id, self.parents[brick_id]
+
+        return root_id
+
+    # adds a stud connection and merges the components of the two bricks (bricks that aren't tracked are skipped)
+    def connect(self, first_id, second_id):
+        if first_id == second_id or first_id not in self.parents or second_id not in self.parents:
+            return
+
+        self.connections[first_id].add(second_id)
+        self.connections[second_id].add(first_id)
+
+        first_root, second_root = self.find(first_id), self.find(second_id)
+
+        if first_root == second_root:
+            return
+
+        # merge the smaller component into the larger one
+        if len(self.members[first_root]) < len(self.members[second_root]):
+            first_root, second_root = second_root, first_root
+
+        self.parents[second_root] = first_root
+        self.members[first_root] |= self.members.pop(second_root)
+        self.first_bricks[first_root] = min(self.first_bricks[first_root], self.first_bricks.pop(second_root))
+
+    # removes a brick with all of its connections and splits its component if needed
+    def remove_brick(self, brick_id):
+        if brick_id not in self.parents:
+            return
+
+        root_id = self.find(brick_id)
+        remaining_bricks = self.members.pop(root_id)
+        remaining_bricks.discard(brick_id)
+        del self.first_bricks[root_id]
+
+        for connected_id in self.connections.pop(brick_id):
+            self.connections[connected_id].discard(brick_id)
+
+        del self.parents[brick_id]
+        del self.brick_order[brick_id]
+
+        # rebuild only the components of the removed brick's component (search through the remaining connections)
+        while remaining_bricks:
+            start_id = remaining_bricks.pop()
+            component = {start_id}
+            stack = [start_id]
+
+            while stack:
+                for connected_id in self.connections[stack.pop()]:
+                    if connected_id not in component:
+                        component.add(connected_id)
+                        stack.append(connected_id)
+
+            remaining_bricks -= component
+
+            for member_id in component:
+                self.parents[member_id] = start_id
+
+            self.members[start_id] = component
+            self.first_bricks[start_id] = min(self.brick_order[member_id] for member_id in component)
+
+    # returns the number of components
+    def component_count(self):
+        return len(self.members)
+
+    # returns the bricks of the brick's component (read only)
+    def component(self, brick_id):
+        return self.members[self.find(brick_id)]
+
+    # returns all components (read only sets of brick ids) in the order of their first placed brick
+    def components(self):
+        return [self.members[root_id] for root_id in sorted(self.members, key=self.first_bricks.get)]
+
+    # returns the component with the most bricks (the first placed one if there are more of the same size)
+    def largest_component(self):
+        return max(self.components(), key=len)
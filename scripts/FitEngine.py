@@ -0,0 +1,810 @@
+import time
+import itertools
+import numpy as np
+import scipy.ndimage
+import scipy.signal
+from enum import Enum
+
+class FitBackend(Enum):
+    CORRELATION = 0 # scipy correlation of the brick kernel over the grid
+    INTEGRAL_VOLUME = 1 # box sums of a summed-area table (one table per grid state is shared by all kernels)
+    BIT_PACKED = 2 # shifted AND reductions of the bit-packed occupancy grid (one bit per voxel)
+    FFT = 3 # correlation through fast fourier transforms (fast for big kernels)
+    SEPARABLE = 4 # three 1D box filters (only for all-ones kernels, other kernels use the correlation)
+    AUTO = 5 # the fastest of CORRELATION, FFT and SEPARABLE, measured per grid and kernel shape on first use
+
+# returns the kernel and origin that scipy correlates with when it is asked to convolve (flipped kernel, mirrored origin)
+def convolution_as_correlation(kernel, origin):
+    flipped_kernel = kernel[::-1, ::-1, ::-1]
+    adjusted_origin = tuple(-axis_origin - (1 if axis_size % 2 == 0 else 0) for axis_origin, axis_size in zip(origin, kernel.shape))
+
+    return flipped_kernel, adjusted_origin
+
+# returns the kernel index that lands on the output position in a correlation (kernel center shifted by the origin)
+def kernel_anchor(kernel, origin):
+    return tuple(axis_size // 2 + axis_origin for axis_size, axis_origin in zip(kernel.shape, origin))
+
+# returns a grid that marks every position where the whole kernel fits into empty voxels (same result as apply_correlation)
+def correlate_fit(voxel_grid, kernel, origin):
+    correlation_grid = scipy.ndimage.correlate(voxel_grid, kernel, output=np.int32, mode='constant', cval=0, origin=origin)
+
+    return correlation_grid == kernel.sum()
+
+# returns the same fit grid as correlate_fit, calculated with fast fourier transforms
+def fft_fit(voxel_grid, kernel, origin):
+    anchor = kernel_anchor(kernel, origin)
+
+    # a full convolution with the flipped kernel is the correlation shifted by the kernel size (zero padded like cval=0)
+    convolved_grid = scipy.signal.fftconvolve(voxel_grid.astype(np.float64), kernel[::-1, ::-1, ::-1].astype(np.float64), mode='full')
+    correlation_slices = tuple(slice(kernel.shape[axis] - 1 - anchor[axis], kernel.shape[axis] - 1 - anchor[axis] + voxel_grid.shape[axis]) for axis in range(3))
+
+    # round away the floating point error of the transforms
+    return np.rint(convolved_grid[correlation_slices]) == kernel.sum()
+
+# returns the same fit grid as correlate_fit for all-ones kernels, calculated with a 1D box filter along each axis
+def separable_fit(voxel_grid, kernel, origin):
+    if not kernel.all():
+        return correlate_fit(voxel_grid, kernel, origin)
+
+    box_sums = voxel_grid.astype(np.int32)
+
+    for axis in range(3):
+        box_filter = np.ones(kernel.shape[axis], dtype=np.int32)
+        box_sums = scipy.ndimage.correlate1d(box_sums, box_filter, axis=axis, mode='constant', cval=0, origin=origin[axis])
+
+    return box_sums == kernel.size
+
+# fastest fit function for each (grid shape rounded up to powers of two, kernel shape, all-ones kernel) key
+calibration_table = {}
+
+# returns the same fit grid as correlate_fit, calculated with the fastest method for the grid and kernel shape
+def auto_fit(voxel_grid, kernel, origin):
+    box_kernel = bool(kernel.all())
+    grid_bucket = tuple(1 << max(int(axis_size) - 1, 0).bit_length() for axis_size in voxel_grid.shape)
+    key = (grid_bucket, kernel.shape, box_kernel)
+
+    if key in calibration_table:
+        return calibration_table[key](voxel_grid, kernel, origin)
+
+    # time every method once (they all return the same fit grid) and remember the fastest one
+    fit_functions = [correlate_fit, fft_fit] + ([separable_fit] if box_kernel else [])
+    timings = []
+
+    for fit_function in fit_functions:
+        start = time.perf_counter()
+        fit_grid = fit_function(voxel_grid, kernel, origin)
+        timings.append(time.perf_counter() - start)
+
+    calibration_table[key] = fit_functions[int(np.argmin(timings))]
+
+    return fit_grid
+
+# cache of decomposed kernels (key: kernel shape and content, value: list of boxes)
+kernel_boxes_cache = {}
+
+# returns disjoint boxes (offset, shape) that together cover exactly the filled voxels of a (possibly irregular) kernel
+def decompose_kernel(kernel):
+    key = (kernel.shape, kernel.tobytes())
+
+    if key in kernel_boxes_cache:
+        return kernel_boxes_cache[key]
+
+    remaining = kernel != 0
+    boxes = []
+
+    for x, y, z in np.argwhere(remaining):
+        # the voxel is already covered by a previous box
+        if not remaining[x, y, z]:
+            continue
+
+        # grow the box as far as possible along X, then Y and then Z
+        x_end = x + 1
+        while x_end < kernel.shape[0] and remaining[x_end, y, z]:
+            x_end += 1
+
+        y_end = y + 1
+        while y_end < kernel.shape[1] and remaining[x:x_end, y_end, z].all():
+            y_end += 1
+
+        z_end = z + 1
+        while z_end < kernel.shape[2] and remaining[x:x_end, y:y_end, z_end].all():
+            z_end += 1
+
+        remaining[x:x_end, y:y_end, z:z_end] = False
+        boxes.append(((int(x), int(y), int(z)), (int(x_end - x), int(y_end - y), int(z_end - z))))
+
+    kernel_boxes_cache[key] = boxes
+
+    return boxes
+
+# returns the range of kernel positions (indexed by the kernel's first voxel) where all filled kernel voxels are inside the grid
+def kernel_position_range(grid_shape, kernel, origin):
+    anchor = kernel_anchor(kernel, origin)
+    filled_indices = np.argwhere(kernel != 0)
+
+    # the output position (kernel position + anchor) has to be inside of the grid
+    lower = [-anchor[axis] for axis in range(3)]
+    upper = [grid_shape[axis] - 1 - anchor[axis] for axis in range(3)]
+
+    # and so do all the filled voxels of the kernel (an empty kernel fits everywhere)
+    if filled_indices.size > 0:
+        filled_lower, filled_upper = filled_indices.min(axis=0), filled_indices.max(axis=0)
+        lower = [int(max(lower[axis], -filled_lower[axis])) for axis in range(3)]
+        upper = [int(min(upper[axis], grid_shape[axis] - 1 - filled_upper[axis])) for axis in range(3)]
+
+    return lower, upper, anchor
+
+class IntegralVolume:
+    def __init__(self, voxel_grid):
+        self.shape = voxel_grid.shape
+
+        # the sums can't overflow 32 bits unless the grid has more than 2^31 voxels
+        dtype = np.int32 if voxel_grid.size < 2**31 else np.int64
+
+        # summed-area table padded with a zero layer on the lower side of every axis
+        self.table = np.zeros(tuple(axis_size + 1 for axis_size in self.shape), dtype=dtype)
+        np.cumsum(voxel_grid, axis=0, dtype=dtype, out=self.table[1:, 1:, 1:])
+        np.cumsum(self.table[1:, 1:, 1:], axis=1, out=self.table[1:, 1:, 1:])
+        np.cumsum(self.table[1:, 1:, 1:], axis=2, out=self.table[1:, 1:, 1:])
+
+    # returns the sums of all boxes of the input shape (indexed by their lowest corner, for every box that is inside the grid)
+    def box_sums(self, box_shape):
+        if any(box_size > axis_size for box_size, axis_size in zip(box_shape, self.shape)):
+            return np.zeros((0, 0, 0), dtype=self.table.dtype)
+
+        lower = [slice(0, axis_size + 1 - box_size) for axis_size, box_size in zip(self.shape, box_shape)]
+        upper = [slice(box_size, axis_size + 1) for axis_size, box_size in zip(self.shape, box_shape)]
+        table = self.table
+
+        # inclusion-exclusion of the 8 corners of every box
+        return (table[upper[0], upper[1], upper[2]]
+                - table[lower[0], upper[1], upper[2]] - table[upper[0], lower[1], upper[2]] - table[upper[0], upper[1], lower[2]]
+                + table[lower[0], lower[1], upper[2]] + table[lower[0], upper[1], lower[2]] + table[upper[0], lower[1], lower[2]]
+                - table[lower[0], lower[1], lower[2]])
+
+    # returns the same fit grid as correlate_fit (the filled kernel voxels are split into boxes that all have to be full)
+    def fit_grid(self, kernel, origin):
+        lower, upper, anchor = kernel_position_range(self.shape, kernel, origin)
+        fit_grid = np.zeros(self.shape, dtype=bool)
+
+        if any(lower[axis] > upper[axis] for axis in range(3)):
+            return fit_grid
+
+        fits = np.ones(tuple(upper[axis] - lower[axis] + 1 for axis in range(3)), dtype=bool)
+
+        for offset, box_shape in decompose_kernel(kernel):
+            sums = self.box_sums(box_shape)
+            box_slices = tuple(slice(lower[axis] + offset[axis], upper[axis] + offset[axis] + 1) for axis in range(3))
+            fits &= sums[box_slices] == box_shape[0] * box_shape[1] * box_shape[2]
+
+        fit_grid[tuple(slice(lower[axis] + anchor[axis], upper[axis] + anchor[axis] + 1) for axis in range(3))] = fits
+
+        return fit_grid
+
+    # returns the sums of the boxes of the input shape whose lowest corners are on the (n, 3) positions
+    def position_sums(self, positions, box_shape):
+        flat_table = self.table.reshape(-1)
+        lower_indices = np.ravel_multi_index(tuple(positions.T), self.table.shape)
+        sums = np.zeros(len(positions), dtype=self.table.dtype)
+
+        # inclusion-exclusion of the 8 corners of every box (the corners with an even number of upper sides are subtracted)
+        for corner in itertools.product((0, 1), repeat=3):
+            corner_offset = np.ravel_multi_index(tuple(box_shape[axis] * corner[axis] for axis in range(3)), self.table.shape)
+
+            if sum(corner) % 2 == 1:
+                sums += flat_table[lower_indices + corner_offset]
+            else:
+                sums -= flat_table[lower_indices + corner_offset]
+
+        return sums
+
+    # returns potential spawn positions for the irregular brick (same as HelperFunctions.apply_correlation)
+    def apply_correlation(self, brick):
+        return np.argwhere(self.fit_grid(brick.brick_kernel, brick.kernel_origin))
+
+    # returns potential spawn positions for the brick (same as HelperFunctions.apply_convolution)
+    def apply_convolution(self, brick):
+        kernel, origin = convolution_as_correlation(brick.brick_kernel, brick.kernel_origin)
+
+        return np.argwhere(self.fit_grid(kernel, origin))
+
+# X and Y pooling factors of the coarse levels of the occupancy pyramid (from the finest to the coarsest level)
+pyramid_factors = (2, 4)
+
+# returns the grid min-pooled by the factor in X and Y (a coarse voxel is 1 only if all the voxels of its block are 1,
+# the blocks that stick out of the grid are 0)
+def min_pool_layers(voxel_grid, factor):
+    pooled_shape = (-(-voxel_grid.shape[0] // factor), -(-voxel_grid.shape[1] // factor), voxel_grid.shape[2])
+    full_shape = (voxel_grid.shape[0] // factor, voxel_grid.shape[1] // factor)
+    pooled_grid = np.zeros(pooled_shape, dtype=bool, order='F')
+    full_blocks = pooled_grid[:full_shape[0], :full_shape[1]]
+    full_blocks[...] = True
+
+    # AND the voxels at every offset inside of the blocks
+    for x_offset, y_offset in itertools.product(range(factor), repeat=2):
+        full_blocks &= voxel_grid[x_offset:full_shape[0] * factor:factor, y_offset:full_shape[1] * factor:factor] != 0
+
+    return pooled_grid
+
+# returns the coarsest pyramid factor where a box kernel of the shape always covers whole blocks in X and Y, no matter how it
+# is aligned to them, and the shape of the blocks it always covers (None for kernels that are too small for every level)
+def coarse_kernel_level(kernel_shape, factors=pyramid_factors):
+    for factor in reversed(factors):
+        coarse_shape = ((kernel_shape[0] + 1) // factor - 1, (kernel_shape[1] + 1) // factor - 1, kernel_shape[2])
+
+        if coarse_shape[0] > 0 and coarse_shape[1] > 0:
+            return factor, coarse_shape
+
+    return None
+
+# min-pooled copies of the grid that rule out most positions of large box kernels without looking at every voxel
+class OccupancyPyramid:
+    def __init__(self, voxel_grid, factors=pyramid_factors):
+        self.shape = voxel_grid.shape
+        self.factors = factors
+        self.levels = {} # min-pooled grid of every level (key: factor), every level is pooled from the previous one
+
+        level, level_factor = voxel_grid, 1
+
+        for factor in factors:
+            level = min_pool_layers(level, factor // level_factor)
+            level_factor = factor
+            self.levels[factor] = level
+
+    # returns the positions (lowest kernel voxel, inside of the grid) where a box kernel of the shape can fit according to
+    # its coarse level (None for kernels too small for every level), the positions still have to be checked on the grid
+    def candidate_positions(self, kernel_shape):
+        coarse_level = coarse_kernel_level(kernel_shape, self.factors)
+
+        if coarse_level is None:
+            return None
+
+        factor, coarse_shape = coarse_level
+        level = self.levels[factor]
+
+        # the kernel at position p always covers the coarse blocks from ceil(p / factor) on, all of them have to be full
+        coarse_sums = IntegralVolume(level).box_sums(coarse_shape)
+        coarse_xs, coarse_ys, zs = np.nonzero(coarse_sums == coarse_shape[0] * coarse_shape[1] * coarse_shape[2])
+
+        # so every coarse position stands for the factor x factor kernel positions that start in the block before it
+        x_offsets, y_offsets = np.meshgrid(np.arange(1 - factor, 1), np.arange(1 - factor, 1), indexing='ij')
+        xs = (coarse_xs[:, None] * factor + x_offsets.ravel()).ravel()
+        ys = (coarse_ys[:, None] * factor + y_offsets.ravel()).ravel()
+        zs = np.repeat(zs, factor * factor)
+
+        # the Z range of the coarse positions already keeps the kernel inside of the grid
+        inside = (xs >= 0) & (xs <= self.shape[0] - kernel_shape[0]) & (ys >= 0) & (ys <= self.shape[1] - kernel_shape[1])
+
+        return np.stack((xs[inside], ys[inside], zs[inside]), axis=1)
+
+# returns the part of the words array between start and start + length along the axis
+def slice_axis(words, axis, start, length):
+    slices = [slice(None)] * words.ndim
+    slices[axis] = slice(start, start + length)
+
+    return words[tuple(slices)]
+
+# returns the AND of every window of the input size along the X or Z axis of the packed words (window doubles each step)
+def sliding_and(words, size, axis):
+    windows = words
+    span = 1
+
+    while span * 2 <= size:
+        length = windows.shape[axis] - span
+        windows = slice_axis(windows, axis, 0, length) & slice_axis(windows, axis, span, length)
+        span *= 2
+
+    # two overlapping windows of the largest span cover the remaining size
+    if span < size:
+        length = windows.shape[axis] - (size - span)
+        windows = slice_axis(windows, axis, 0, length) & slice_axis(windows, axis, size - span, length)
+
+    return windows
+
+# returns the packed rows shifted along Y so that bit y of the result is bit y + shift of the input (zeros are shifted in)
+def shift_bits(words, shift):
+    if shift == 0:
+        return words.copy()
+
+    word_shift, bit_shift = divmod(abs(shift), 64)
+    word_count = words.shape[-1]
+    shifted = np.zeros_like(words)
+
+    if word_shift >= word_count:
+        return shifted
+
+    if shift > 0:
+        # move higher bits down (towards lower Y)
+        shifted[..., :word_count - word_shift] = words[..., word_shift:] >> np.uint64(bit_shift)
+
+        if bit_shift > 0:
+            shifted[..., :word_count - word_shift - 1] |= words[..., word_shift + 1:] << np.uint64(64 - bit_shift)
+    else:
+        # move lower bits up (towards higher Y)
+        shifted[..., word_shift:] = words[..., :word_count - word_shift] << np.uint64(bit_shift)
+
+        if bit_shift > 0:
+            shifted[..., word_shift + 1:] |= words[..., :word_count - word_shift - 1] >> np.uint64(64 - bit_shift)
+
+    return shifted
+
+# returns the AND of every window of the input size along the packed Y axis
+def sliding_and_bits(words, size):
+    windows = words
+    span = 1
+
+    while span * 2 <= size:
+        windows = windows & shift_bits(windows, span)
+        span *= 2
+
+    if span < size:
+        windows = windows & shift_bits(windows, size - span)
+
+    return windows
+
+# returns a bit mask (one uint64 per word) with the bits from y_start up to (excluding) y_end set
+def row_mask(word_count, y_start, y_end):
+    mask = np.zeros(word_count, dtype=np.uint64)
+
+    for word in range(y_start // 64, (y_end - 1) // 64 + 1):
+        lowest_bit = max(y_start, word * 64) - word * 64
+        highest_bit = min(y_end, word * 64 + 64) - word * 64
+        mask[word] = ((1 << (highest_bit - lowest_bit)) - 1) << lowest_bit
+
+    return mask
+
+# returns the voxel_grid packed into a PackedGrid (every non-zero voxel becomes a set bit)
+def pack_voxel_grid(voxel_grid):
+    x_size, y_size, z_size = voxel_grid.shape
+    word_count = max((y_size + 63) // 64, 1)
+
+    # rows are (x, z) pairs and the bits of a row follow the Y axis
+    padded_rows = np.zeros((x_size, z_size, word_count * 64), dtype=bool)
+    padded_rows[:, :, :y_size] = np.transpose(voxel_grid != 0, (0, 2, 1))
+
+    packed_bytes = np.packbits(padded_rows, axis=2, bitorder='little')
+    words = np.ascontiguousarray(packed_bytes).view('<u8').astype(np.uint64)
+
+    return PackedGrid(voxel_grid.shape, words)
+
+class PackedGrid:
+    def __init__(self, shape, words):
+        self.shape = tuple(shape) # shape of the dense voxel grid (X, Y, Z)
+        self.words = words # uint64 array of shape (X, Z, words per row), bit y of a row is the voxel (x, y, z)
+
+    # returns the dense voxel grid
+    def to_dense(self, dtype=np.int32):
+        packed_bytes = np.ascontiguousarray(self.words.astype('<u8')).view(np.uint8)
+        rows = np.unpackbits(packed_bytes, axis=2, count=self.shape[1], bitorder='little')
+
+        return np.transpose(rows, (0, 2, 1)).astype(dtype)
+
+    # returns a view of the layers from z_start up to (excluding) z_end (it shares the words with this grid)
+    def layer(self, z_start, z_end):
+        return self.window(slice(0, self.shape[0]), slice(z_start, z_end))
+
+    # returns a view of the rows inside the X and Z slices (Y is always whole)
+    def window(self, x_slice, z_slice):
+        words = self.words[x_slice, z_slice, :]
+
+        return PackedGrid((words.shape[0], self.shape[1], words.shape[1]), words)
+
+    # sets all voxels of a box to the input value (1 = empty space that still needs a brick, 0 = filled)
+    def set_box(self, x_pos, y_pos, z_pos, shape, value):
+        y_end = min(y_pos + shape[1], self.shape[1])
+
+        if y_end <= y_pos:
+            return
+
+        first_word, last_word = y_pos // 64, (y_end - 1) // 64
+        mask = row_mask(self.words.shape[2], y_pos, y_end)[first_word:last_word + 1]
+        rows = self.words[x_pos:x_pos + shape[0], z_pos:z_pos + shape[2], first_word:last_word + 1]
+
+        if value:
+            rows |= mask
+        else:
+            rows &= ~mask
+
+    # sets the voxels at the input indices to the input value
+    def set_voxels(self, xs, ys, zs, value):
+        ys = np.asarray(ys)
+        bits = np.left_shift(np.uint64(1), (ys % 64).astype(np.uint64))
+
+        if value:
+            np.bitwise_or.at(self.words, (xs, zs, ys // 64), bits)
+        else:
+            np.bitwise_and.at(self.words, (xs, zs, ys // 64), ~bits)
+
+    # repacks the layers starting at z_start from a dense layer
+    def set_layer(self, z_start, voxel_grid_layer):
+        self.words[:, z_start:z_start + voxel_grid_layer.shape[2], :] = pack_voxel_grid(voxel_grid_layer).words
+
+    # returns the packed rows where bit (x, z, y) is set if the whole box starting at (x, y, z) is empty space
+    def box_full_words(self, box_shape):
+        full_words = sliding_and(self.words, box_shape[0], 0)
+        full_words = sliding_and(full_words, box_shape[2], 1)
+
+        return sliding_and_bits(full_words, box_shape[1])
+
+    # returns the same fit grid as correlate_fit (every box of the kernel has to be empty space)
+    def fit_grid(self, kernel, origin):
+        x_size, y_size, z_size = self.shape
+        anchor = kernel_anchor(kernel, origin)
+
+        # every position inside the grid starts as fitting (bits above the Y size are never set)
+        fits = np.empty_like(self.words)
+        fits[:] = row_mask(self.words.shape[2], 0, y_size)
+
+        for offset, box_shape in decompose_kernel(kernel):
+            # the box can't fit anywhere if it is bigger than the grid
+            if box_shape[0] > x_size or box_shape[1] > y_size or box_shape[2] > z_size:
+                return np.zeros(self.shape, dtype=bool)
+
+            box_words = self.box_full_words(box_shape)
+
+            # the box of the output position i starts at i + shift
+            shift = [offset[axis] - anchor[axis] for axis in range(3)]
+            x_start, x_end = max(0, -shift[0]), min(x_size - 1, x_size - box_shape[0] - shift[0])
+            z_start, z_end = max(0, -shift[2]), min(z_size - 1, z_size - box_shape[2] - shift[2])
+
+            if x_start > x_end or z_start > z_end:
+                return np.zeros(self.shape, dtype=bool)
+
+            # positions whose box would start outside of the grid can't fit
+            fits[:x_start] = 0
+            fits[x_end + 1:] = 0
+            fits[:, :z_start] = 0
+            fits[:, z_end + 1:] = 0
+
+            box_rows = box_words[x_start + shift[0]:x_end + shift[0] + 1, z_start + shift[2]:z_end + shift[2] + 1]
+            fits[x_start:x_end + 1, z_start:z_end + 1] &= shift_bits(box_rows, shift[1])
+
+        return PackedGrid(self.shape, fits).to_dense(bool)
+
+    # returns potential spawn positions for the irregular brick (same as HelperFunctions.apply_correlation)
+    def apply_correlation(self, brick):
+        return np.argwhere(self.fit_grid(brick.brick_kernel, brick.kernel_origin))
+
+    # returns potential spawn positions for the brick (same as HelperFunctions.apply_convolution)
+    def apply_convolution(self, brick):
+        kernel, origin = convolution_as_correlation(brick.brick_kernel, brick.kernel_origin)
+
+        return np.argwhere(self.fit_grid(kernel, origin))
+
+# returns the (lower corner, upper corner) boxes of the chunk rows along the X axis that contain empty voxels
+# (a box spans from the first to the last chunk of its row with empty voxels, the corners are inclusive)
+def occupied_chunk_rows(voxel_grid, chunk_size):
+    if voxel_grid.size == 0:
+        return []
+
+    # reduce the grid to one value per chunk
+    occupied_chunks = voxel_grid != 0
+
+    for axis in range(3):
+        occupied_chunks = np.logical_or.reduceat(occupied_chunks, np.arange(0, voxel_grid.shape[axis], chunk_size), axis=axis)
+
+    boxes = []
+
+    for chunk_y, chunk_z in np.argwhere(occupied_chunks.any(axis=0)):
+        chunk_xs = np.flatnonzero(occupied_chunks[:, chunk_y, chunk_z])
+        lower = (chunk_xs[0] * chunk_size, chunk_y * chunk_size, chunk_z * chunk_size)
+        end = ((chunk_xs[-1] + 1) * chunk_size, (chunk_y + 1) * chunk_size, (chunk_z + 1) * chunk_size)
+        boxes.append((tuple(int(index) for index in lower), tuple(int(min(index, axis_size)) - 1 for index, axis_size in zip(end, voxel_grid.shape))))
+
+    return boxes
+
+# returns the fit grid of the kernel calculated with the selected backend
+def calculate_fit_grid(voxel_grid, kernel, origin, backend=FitBackend.CORRELATION):
+    if backend == FitBackend.INTEGRAL_VOLUME:
+        return IntegralVolume(voxel_grid).fit_grid(kernel, origin)
+    elif backend == FitBackend.BIT_PACKED:
+        return pack_voxel_grid(voxel_grid).fit_grid(kernel, origin)
+    elif backend == FitBackend.FFT:
+        return fft_fit(voxel_grid, kernel, origin)
+    elif backend == FitBackend.SEPARABLE:
+        return separable_fit(voxel_grid, kernel, origin)
+    elif backend == FitBackend.AUTO:
+        return auto_fit(voxel_grid, kernel, origin)
+
+    return correlate_fit(voxel_grid, kernel, origin)
+
+# voxel offsets of every kernel (key: kernel shape and kernel bytes)
+kernel_offsets_cache = {}
+
+# returns the offsets of the kernel voxels from the start of the kernel (in the order of np.argwhere)
+def kernel_voxel_offsets(kernel):
+    key = (kernel.shape, kernel.tobytes())
+
+    if key not in kernel_offsets_cache:
+        offsets = np.argwhere(kernel != 0)
+        offsets.setflags(write=False)
+        kernel_offsets_cache[key] = offsets
+
+    return kernel_offsets_cache[key]
+
+# returns the indices of all voxels that the kernels placed on the positions cover (kernels start at the positions)
+def kernel_voxel_indices(kernel, positions):
+    offsets = kernel_voxel_offsets(kernel)
+    voxels = (np.asarray(positions).reshape(-1, 1, 3) + offsets[np.newaxis, :, :]).reshape(-1, 3)
+
+    return voxels[:, 0], voxels[:, 1], voxels[:, 2]
+
+# returns a maximal set of fitting positions whose kernels don't overlap (greedy in the input order)
+# if mirror is set, the position mirrored over the middle of the X axis is taken right after the original (if it fits)
+def select_non_overlapping(fitting_positions, kernel, grid_shape, mirror=False):
+    claimed_voxels = np.zeros(grid_shape, dtype=bool)
+    offsets = np.argwhere(kernel != 0)
+    box_kernel = bool(kernel.all())
+    fitting_set = {tuple(int(index) for index in position) for position in fitting_positions}
+    selected_positions = []
+
+    # bricks longer than half of the model cannot be mirrored
+    if kernel.shape[0] > grid_shape[0] / 2:
+        mirror = False
+
+    # claims the voxels of the kernel on the position if none of them are claimed yet
+    def claim(position):
+        x_pos, y_pos, z_pos = position
+
+        if box_kernel:
+            kernel_voxels = (slice(x_pos, x_pos + kernel.shape[0]), slice(y_pos, y_pos + kernel.shape[1]), slice(z_pos, z_pos + kernel.shape[2]))
+        else:
+            kernel_voxels = tuple((np.asarray(position) + offsets).T)
+
+        if claimed_voxels[kernel_voxels].any():
+            return False
+
+        claimed_voxels[kernel_voxels] = True
+        selected_positions.append(position)
+        return True
+
+    for position in fitting_positions:
+        position = tuple(int(index) for index in position)
+
+        if not claim(position):
+            continue
+
+        if mirror:
+            mirrored_position = (grid_shape[0] - position[0] - kernel.shape[0], position[1], position[2])
+
+            if mirrored_position != position and mirrored_position in fitting_set:
+                claim(mirrored_position)
+
+    return selected_positions
+
+# returns the lowest fitting position that has a mirrored fitting position (over the middle of the X axis) with its pair
+# (the mirrored position can be on another height, only the original is returned if it stretches over the middle)
+def find_mirrored_positions(fitting_positions, grid_shape, brick_length):
+    # bricks longer than half of the model cannot be mirrored
+    if brick_length > grid_shape[0] / 2:
+        return []
+
+    # if there is only one fitting position return it
+    if len(fitting_positions) == 1:
+        return [tuple(index.item() for index in fitting_positions[0])]
+
+    if len(fitting_positions) == 0:
+        return []
+
+    # sort the positions by height (a stable sort keeps the order of the positions with the same height)
+    fitting_positions = np.asarray(fitting_positions).reshape(-1, 3)
+    sorted_positions = fitting_positions[np.argsort(fitting_positions[:, 2], kind='stable')]
+
+    # linearize the (x, y) of every position and of its mirrored position
+    position_indices = sorted_positions[:, 0] * grid_shape[1] + sorted_positions[:, 1]
+    mirrored_xs = grid_shape[0] - sorted_positions[:, 0] - brick_length
+    mirrored_indices = mirrored_xs * grid_shape[1] + sorted_positions[:, 1]
+
+    # find the positions whose mirrored position is also a fitting position
+    has_mirrored_position = (mirrored_xs >= 0) & np.isin(mirrored_indices, position_indices)
+
+    if not has_mirrored_position.any():
+        return []
+
+    # take the lowest position that can be mirrored and the lowest matching mirrored position
+    position_index = np.argmax(has_mirrored_position)
+    mirrored_position_index = np.argmax(position_indices == mirrored_indices[position_index])
+
+    position = tuple(index.item() for index in sorted_positions[position_index])
+    mirrored_position = tuple(index.item() for index in sorted_positions[mirrored_position_index])
+
+    # only return the original if the voxels of it stretch over the middle of the model
+    if position[0] <= int(grid_shape[0] / 2) < position[0] + brick_length:
+        return [position]
+
+    # set and then list to clear duplicates
+    return list(set([position, mirrored_position]))
+
+class FitMap:
+    # number of pending dirty windows after which a full recomputation is cheaper than patching every window
+    max_dirty_windows = 32
+
+    def __init__(self, voxel_grid, z_offset=0, backend=FitBackend.CORRELATION, packed_grid=None, x_offset=0, y_offset=0, chunk_size=None,
+                 coarse_to_fine=False):
+        self.voxel_grid = voxel_grid # the grid (or layer/region view of the global grid) that the fits are calculated on
+        self.z_offset = z_offset # Z index of the first layer of the grid in the global voxel_grid
+        self.x_offset = x_offset # X and Y index of the first voxel of the grid in the global voxel_grid (region views)
+        self.y_offset = y_offset
+        self.backend = backend
+        self.packed_grid = packed_grid # packed view of the same voxels (kept up to date by the LayerSlicer)
+        self.chunk_size = chunk_size # fits are only calculated around the chunks of this size with empty voxels (None = whole grid,
+                                     # not used with the BIT_PACKED backend)
+        self.coarse_to_fine = coarse_to_fine # large box kernels are first searched on the occupancy pyramid of the grid
+
+        # without a shared packed grid every fit would have to pack the dense grid first
+        if self.backend == FitBackend.BIT_PACKED and self.packed_grid is None:
+            self.packed_grid = pack_voxel_grid(voxel_grid)
+        self.fit_grids = {} # cached fit grids (key: kernel and origin, value: [fit grid, number of applied dirty windows])
+        self.dirty_windows = [] # (lower corner, upper corner) of every region that changed since the fit map was created
+        self.integral_volume = None # summed-area table shared by all kernels (key: number of applied dirty windows)
+        self.integral_volume_windows = 0
+        self.pyramid = None # occupancy pyramid shared by all kernels (key: number of applied dirty windows)
+        self.pyramid_windows = 0
+
+    # returns potential spawn positions for the irregular brick (same as HelperFunctions.apply_correlation)
+    def apply_correlation(self, brick):
+        return np.argwhere(self.get_fit_grid(brick.brick_kernel, brick.kernel_origin))
+
+    # returns potential spawn positions for the brick (same as HelperFunctions.apply_convolution)
+    def apply_convolution(self, brick):
+        kernel, origin = convolution_as_correlation(brick.brick_kernel, brick.kernel_origin)
+
+        return np.argwhere(self.get_fit_grid(kernel, origin))
+
+    # returns whether the irregular brick fits on a single position of the grid (same as checking apply_correlation)
+    def correlation_fits(self, brick, x_pos, y_pos, z_pos):
+        fit_grid = self.get_fit_grid(brick.brick_kernel, brick.kernel_origin)
+
+        if not all(0 <= index < size for index, size in zip((x_pos, y_pos, z_pos), fit_grid.shape)):
+            return False
+
+        return bool(fit_grid[x_pos, y_pos, z_pos])
+
+    # marks a box of the global voxel_grid as changed (the fit grids are only recalculated around it on the next query)
+    def mark_dirty(self, x_pos, y_pos, z_pos, shape):
+        lower = [x_pos - self.x_offset, y_pos - self.y_offset, z_pos - self.z_offset]
+        upper = [lower[axis] + shape[axis] - 1 for axis in range(3)]
+
+        # clip the box to the grid (a layer or region only sees the part of the box that overlaps it)
+        for axis in range(3):
+            lower[axis] = max(lower[axis], 0)
+            upper[axis] = min(upper[axis], self.voxel_grid.shape[axis] - 1)
+
+            if lower[axis] > upper[axis]:
+                return
+
+        self.dirty_windows.append((tuple(lower), tuple(upper)))
+
+    # drops all cached fit grids (used when the whole grid is replaced or changed)
+    def invalidate(self):
+        self.fit_grids.clear()
+        self.dirty_windows.clear()
+        self.integral_volume = None
+        self.pyramid = None
+
+    # returns the summed-area table of the grid (rebuilt only if the grid changed since it was built)
+    def current_integral_volume(self):
+        if self.integral_volume is None or self.integral_volume_windows != len(self.dirty_windows):
+            self.integral_volume = IntegralVolume(self.voxel_grid)
+            self.integral_volume_windows = len(self.dirty_windows)
+
+        return self.integral_volume
+
+    # returns the occupancy pyramid of the grid (rebuilt only if the grid changed since it was built)
+    def current_pyramid(self):
+        if self.pyramid is None or self.pyramid_windows != len(self.dirty_windows):
+            self.pyramid = OccupancyPyramid(self.voxel_grid)
+            self.pyramid_windows = len(self.dirty_windows)
+
+        return self.pyramid
+
+    # returns the fit grid of the kernel over the whole grid
+    def full_fit(self, kernel, origin):
+        # the packed backend already tests whole words of voxels at once (it is faster without the pyramid)
+        if self.coarse_to_fine and self.backend != FitBackend.BIT_PACKED:
+            fit_grid = self.coarse_to_fine_fit(kernel, origin)
+
+            if fit_grid is not None:
+                return fit_grid
+
+        # packed windows always hold whole Y rows, so fitting the chunk rows one by one repeats the same rows (the whole grid
+        # is faster)
+        if self.chunk_size is not None and self.backend != FitBackend.BIT_PACKED:
+            return self.occupied_chunks_fit(kernel, origin)
+
+        if self.backend == FitBackend.INTEGRAL_VOLUME:
+            return self.current_integral_volume().fit_grid(kernel, origin)
+        elif self.backend == FitBackend.BIT_PACKED:
+            return self.packed_grid.fit_grid(kernel, origin)
+
+        return calculate_fit_grid(self.voxel_grid, kernel, origin, self.backend)
+
+    # returns the same fit grid as the whole grid fit, but only calculates the positions whose kernel overlaps a chunk with
+    # empty voxels (every voxel of a fitting kernel is empty, so the positions around the chunks without any can't fit)
+    def occupied_chunks_fit(self, kernel, origin):
+        fit_grid = np.zeros(self.voxel_grid.shape, dtype=bool)
+
+        for lower, upper in occupied_chunk_rows(self.voxel_grid, self.chunk_size):
+            self.refresh_window(fit_grid, kernel, origin, lower, upper)
+
+        return fit_grid
+
+    # returns the same fit grid as the whole grid fit for large box kernels (None for the other kernels, they are searched
+    # on the whole grid): the candidate positions are found on the coarse levels and only they are checked on the grid
+    def coarse_to_fine_fit(self, kernel, origin):
+        if not kernel.all() or coarse_kernel_level(kernel.shape) is None:
+            return None
+
+        candidates = self.current_pyramid().candidate_positions(kernel.shape)
+
+        if candidates is None:
+            return None
+
+        fit_grid = np.zeros(self.voxel_grid.shape, dtype=bool)
+
+        if len(candidates) > 0:
+            box_sums = self.current_integral_volume().position_sums(candidates, kernel.shape)
+            fitting_positions = candidates[box_sums == kernel.size] + kernel_anchor(kernel, origin)
+            fit_grid[tuple(fitting_positions.T)] = True
+
+        return fit_grid
+
+    # returns the up to date fit grid of the kernel (calculates it on first use and then only patches the dirty windows)
+    def get_fit_grid(self, kernel, origin):
+        key = (kernel.shape, kernel.tobytes(), tuple(origin))
+        cached_fit = self.fit_grids.get(key)
+
+        if cached_fit is None:
+            fit_grid = self.full_fit(kernel, origin)
+            self.fit_grids[key] = [fit_grid, len(self.dirty_windows)]
+            return fit_grid
+
+        fit_grid, applied_windows = cached_fit
+        pending_windows = self.dirty_windows[applied_windows:]
+
+        if len(pending_windows) > FitMap.max_dirty_windows:
+            fit_grid = self.full_fit(kernel, origin)
+            cached_fit[0] = fit_grid
+        else:
+            for lower, upper in pending_windows:
+                self.refresh_window(fit_grid, kernel, origin, lower, upper)
+
+        cached_fit[1] = len(self.dirty_windows)
+
+        return fit_grid
+
+    # recalculates the fits of every position whose kernel overlaps the changed box
+    def refresh_window(self, fit_grid, kernel, origin, lower, upper):
+        anchor = kernel_anchor(kernel, origin)
+        output_slices = []
+        input_slices = []
+        local_slices = []
+
+        for axis in range(3):
+            axis_size = self.voxel_grid.shape[axis]
+
+            # positions that have at least one kernel voxel inside the changed box
+            output_start = max(lower[axis] - (kernel.shape[axis] - 1) + anchor[axis], 0)
+            output_end = min(upper[axis] + anchor[axis], axis_size - 1)
+
+            if output_start > output_end:
+                return
+
+            # voxels that the kernels of those positions cover (everything outside of them is outside the grid)
+            input_start = max(output_start - anchor[axis], 0)
+            input_end = min(output_end - anchor[axis] + kernel.shape[axis] - 1, axis_size - 1)
+
+            # packed rows are always used whole
+            if self.backend == FitBackend.BIT_PACKED and axis == 1:
+                input_start, input_end = 0, axis_size - 1
+
+            output_slices.append(slice(output_start, output_end + 1))
+            input_slices.append(slice(input_start, input_end + 1))
+            local_slices.append(slice(output_start - input_start, output_end - input_start + 1))
+
+        if self.backend == FitBackend.BIT_PACKED:
+            window_fit = self.packed_grid.window(input_slices[0], input_slices[2]).fit_grid(kernel, origin)
+        else:
+            window_fit = calculate_fit_grid(self.voxel_grid[tuple(input_slices)], kernel, origin, self.backend)
+
+        fit_grid[tuple(output_slices)] = window_fit[tuple(local_slices)]
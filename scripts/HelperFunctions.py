@@ -2,12 +2,18 @@ import sys
 # change path to your scripts folder
 sys.path.append("./scripts")
 from mathutils import Vector, Euler
+from mathutils.bvhtree import BVHTree
 from Brick import Brick, Orientation
 from enum import Enum
 import bpy
 import numpy as np
 import binvox_rw
 import scipy.ndimage
+import FitEngine
+import Connectivity
+import Voxelizer
+from FitEngine import FitBackend
+from LayerHandler import occupancy_dtype, component_dtype, layer_contiguous, extend_layers, voxel_mask, voxel_indices
 
 class Components(Enum):
     main_model = 0
@@ -21,13 +27,33 @@ class Components(Enum):
     light_rear_right = 8
     cabin = 9
 
+# methods of mapping the voxels of the model to the car components
+class ComponentMapping(Enum):
+    RAY_CAST = 0 # rays from the corners of every voxel to every component
+    SCANLINE = 1 # one ray up through every (x, y) column of a component, the voxels between an odd and an even hit are inside
+
+# what happens to the interior of the model (the voxels deeper inside than the shell)
+class InteriorFill(Enum):
+    SOLID = 0 # the interior gets bricks like the rest of the model
+    EMPTY = 1 # the interior is left empty, only the shell gets bricks
+    PLATES = 2 # the interior is filled with the biggest plates only, the voxels they can't fill are left empty
+
 # returns an adjusted voxel_grid (components voxels are marked filled so normal bricks don't spawn there) and
 # a components_grid where each voxel contains a specific car component ID that it represents
-def check_each_voxel(voxel_grid, components_grid):
+def check_each_voxel(voxel_grid, components_grid, mapping=ComponentMapping.RAY_CAST):
     components = [child_object for child_object in bpy.context.scene.objects[0].children_recursive]
 
+    if mapping == ComponentMapping.SCANLINE:
+        number_of_emptied = map_components_scanline(voxel_grid, components_grid, components)
+        print(f"NUMBER OF EMPTIED VOXELS TO ACCOMMODATE CAR COMPONENTS: {number_of_emptied}")
+
+        return voxel_grid, components_grid
+
     number_of_emptied = 0
 
+    # the inverted matrices of the components are the same for every voxel
+    inverse_matrices = [component.matrix_world.inverted() for component in components]
+
     for x in range(voxel_grid.shape[0]):
         for y in range(voxel_grid.shape[1]):
             for z in range(voxel_grid.shape[2]):
@@ -37,9 +63,9 @@ def check_each_voxel(voxel_grid, components_grid):
 
                 voxel_center = Vector((x + 0.5, y + 0.5, (z + 0.5) * 0.4))
                 
-                for component in components:
+                for component, inverse_matrix in zip(components, inverse_matrices):
                     # mark the voxel as filled if it is inside the mesh of a component
-                    if is_voxel_inside_object(voxel_center, component):
+                    if is_voxel_inside_object(voxel_center, component, inverse_matrix):
                         voxel_grid[x, y, z] = 0
                         components_grid[x, y, z] = Components[component.name].value
                         number_of_emptied += 1
@@ -49,6 +75,64 @@ def check_each_voxel(voxel_grid, components_grid):
 
     return voxel_grid, components_grid
 
+# returns the world Z positions of all the surfaces of the component hit by the ray going up from the world origin
+def column_surface_hits(bvh_tree, matrix_world, inverse_matrix, local_direction, world_origin):
+    local_origin = inverse_matrix @ world_origin
+    hit_zs = []
+
+    while True:
+        location, _, _, _ = bvh_tree.ray_cast(local_origin, local_direction)
+
+        if location is None:
+            return hit_zs
+
+        hit_zs.append((matrix_world @ location).z)
+
+        # continue right behind the hit surface
+        local_origin = location + local_direction * 1e-5
+
+# marks the voxels inside the components (the first component in the list wins) and returns the number of marked voxels
+# every component casts one ray per (x, y) column under its bounding box and fills the voxels between the hits by parity
+def map_components_scanline(voxel_grid, components_grid, components):
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    voxel_z_centers = (np.arange(voxel_grid.shape[2]) + 0.5) * 0.4
+    number_of_emptied = 0
+
+    for component in components:
+        # the tree is built once in the local space of the component (the rays are moved into it with the cached inverted matrix)
+        bvh_tree = BVHTree.FromObject(component, depsgraph)
+        matrix_world = component.matrix_world
+        inverse_matrix = matrix_world.inverted()
+        local_direction = (inverse_matrix.to_3x3() @ Vector((0, 0, 1))).normalized()
+        component_value = Components[component.name].value
+
+        # only the columns under the bounding box of the component can be inside of it
+        world_corners = [matrix_world @ Vector(corner) for corner in component.bound_box]
+        x_start = max(int(np.floor(min(corner.x for corner in world_corners))), 0)
+        x_end = min(int(np.ceil(max(corner.x for corner in world_corners))), voxel_grid.shape[0])
+        y_start = max(int(np.floor(min(corner.y for corner in world_corners))), 0)
+        y_end = min(int(np.ceil(max(corner.y for corner in world_corners))), voxel_grid.shape[1])
+        ray_start_z = min(min(corner.z for corner in world_corners), 0) - 1
+
+        for x in range(x_start, x_end):
+            for y in range(y_start, y_end):
+                # no need to check columns without voxels of the model
+                model_voxels = voxel_grid[x, y] != 0
+
+                if not model_voxels.any():
+                    continue
+
+                hit_zs = np.sort(column_surface_hits(bvh_tree, matrix_world, inverse_matrix, local_direction, Vector((x + 0.5, y + 0.5, ray_start_z))))
+
+                # the voxel center is inside if an odd number of surfaces is below it
+                inside_voxels = model_voxels & (np.searchsorted(hit_zs, voxel_z_centers) % 2 == 1)
+
+                voxel_grid[x, y, inside_voxels] = 0
+                components_grid[x, y, inside_voxels] = component_value
+                number_of_emptied += int(np.count_nonzero(inside_voxels))
+
+    return number_of_emptied
+
 # creates the collections that will contain all the different car components
 def create_collections():
     # delete the Collection that is defaulte
@@ -89,10 +173,10 @@ def get_voxel_corners(voxel_center, voxel_size):
     
     return corners
 
-# returns True if a voxel is inside an object or False if it isn't
-def is_voxel_inside_object(voxel_center, obj):
-    # transform voxel center to the local space
-    local_origin = obj.matrix_world.inverted() @ voxel_center
+# returns True if a voxel is inside an object or False if it isn't (the inverted world matrix of the object can be passed in)
+def is_voxel_inside_object(voxel_center, obj, inverse_matrix=None):
+    if inverse_matrix is None:
+        inverse_matrix = obj.matrix_world.inverted()
     
     # directions to ray cast in local space (3 directions works better than 6 idk why)
     directions = [
@@ -100,17 +184,19 @@ def is_voxel_inside_object(voxel_center, obj):
         Vector((0, 1, 0)),
         Vector((0, 0, 1))
     ]
+
+    # the directions are the same for all the corners
+    local_directions = [(inverse_matrix.to_3x3() @ direction).normalized() for direction in directions]
     
     voxel_corners = get_voxel_corners(voxel_center, 1)
 
     for corner in voxel_corners:
-        local_origin = obj.matrix_world.inverted() @ corner
+        local_origin = inverse_matrix @ corner
         hits = []
     
         # raycast from the voxel to the object in different directions
-        for direction in directions:
-            local_direction = obj.matrix_world.inverted().to_3x3() @ direction
-            result, _, _, _ = obj.ray_cast(local_origin, local_direction.normalized())
+        for local_direction in local_directions:
+            result, _, _, _ = obj.ray_cast(local_origin, local_direction)
 
             if result:
                 # the voxel is in the object in that direction
@@ -128,15 +214,60 @@ def is_voxel_inside_object(voxel_center, obj):
 def adjust_original_voxel_grid(layer_handler, voxel_grid_copy):
     if voxel_grid_copy.shape[2] < layer_handler.voxel_grid.shape[2]:   
         height_difference = layer_handler.voxel_grid.shape[2] - voxel_grid_copy.shape[2]
-        new_layer = np.zeros((layer_handler.voxel_grid.shape[0], layer_handler.voxel_grid.shape[1]))
-
-        for i in range(height_difference):
-            voxel_grid_copy = np.concatenate((voxel_grid_copy, new_layer[:, :, np.newaxis]), axis=2)
+        voxel_grid_copy = extend_layers(voxel_grid_copy, height_difference)
 
-        return np.logical_or(voxel_grid_copy, layer_handler.voxel_grid)
+        return np.logical_or(voxel_grid_copy, layer_handler.voxel_grid, out=voxel_grid_copy)
     else:
         return voxel_grid_copy
 
+# voxels are only connected through their faces (studs connect the Z axis, a brick spanning both voxels the X and Y axis)
+island_structure = scipy.ndimage.generate_binary_structure(3, 1)
+
+# labels the islands of connected model voxels (the voxels that still need a brick and the component voxels)
+# returns the island of every voxel (0 = outside of the model) and the number of voxels of every island (index = island)
+def label_voxel_islands(voxel_grid, components_grid):
+    model_voxels = (voxel_grid == 1) | voxel_mask(components_grid, lambda components: components != 0)
+    island_grid, island_count = scipy.ndimage.label(model_voxels, structure=island_structure)
+    island_sizes = np.bincount(island_grid.ravel(), minlength=island_count + 1)
+    island_sizes[0] = 0
+
+    return island_grid, island_sizes
+
+# returns the voxels of the model that are further from the outside than the shell thickness (X, Y and Z in voxels)
+# (the erosion with the box of the shell is done as one erosion along every axis)
+def interior_voxels(model_voxels, shell_thickness):
+    interior = model_voxels != 0
+
+    for axis, thickness in enumerate(shell_thickness):
+        structure_shape = [1, 1, 1]
+        structure_shape[axis] = 2 * thickness + 1
+        interior = scipy.ndimage.binary_erosion(interior, np.ones(structure_shape, dtype=bool), border_value=0)
+
+    return interior
+
+# returns the index of the highest filled voxel of each (x, y) column of the grid (-1 for empty columns)
+def calculate_column_height_map(voxel_grid):
+    filled_voxels = voxel_grid == 1
+    highest_z = voxel_grid.shape[2] - 1 - np.argmax(filled_voxels[:, :, ::-1], axis=2)
+
+    return np.where(filled_voxels.any(axis=2), highest_z, -1).astype(np.int32)
+
+# returns the (X, Y, Z) slices of the smallest box that contains all the voxel indices (empty slices if there are none)
+def calculate_bounding_box(voxel_indices):
+    voxel_indices = np.asarray(voxel_indices).reshape(-1, 3)
+
+    if len(voxel_indices) == 0:
+        return (slice(0, 0),) * 3
+
+    lower = voxel_indices.min(axis=0)
+    upper = voxel_indices.max(axis=0) + 1
+
+    return tuple(slice(int(start), int(end)) for start, end in zip(lower, upper))
+
+# returns whether the two (X, Y, Z) slice boxes share at least one voxel
+def regions_overlap(first_region, second_region):
+    return all(first.start < second.stop and second.start < first.stop for first, second in zip(first_region, second_region))
+
 # spawns the windscreen of the car
 def spawn_windscreen(windscreen, layer_handler, main_model_material, cabin_length, cabin_height):
     def create_cabin():
@@ -175,7 +306,7 @@ def spawn_windscreen(windscreen, layer_handler, main_model_material, cabin_lengt
                     adjusted_cabin_indices.add((x_empty, y_empty, z_empty))
         
         # adjust the voxel_grid and the components_grid
-        original_cabin_indices = np.argwhere(layer_handler.components_grid == Components.cabin.value)
+        original_cabin_indices = voxel_indices(layer_handler.components_grid, lambda components: components == Components.cabin.value)
 
         for original_index in original_cabin_indices:
             original_x, original_y, original_z = original_index
@@ -184,20 +315,16 @@ def spawn_windscreen(windscreen, layer_handler, main_model_material, cabin_lengt
                 layer_handler.update_voxel_grid_index(original_x, original_y, original_z, False)
                 layer_handler.components_grid[original_x, original_y, original_z] = 0   
         
-        added_layers = []
-
-        # increase the height of the model to the top of the windscreen if the model is too low
-        for _ in range(layer_handler.voxel_grid.shape[2], windscreen_z + windscreen.height + 1):
-            new_layer = np.zeros((layer_handler.voxel_grid.shape[0], layer_handler.voxel_grid.shape[1]))
-            new_voxel_grid = np.concatenate((layer_handler.voxel_grid, new_layer[:, :, np.newaxis]), axis=2)
-            new_components_grid = np.concatenate((layer_handler.components_grid, new_layer[:, :, np.newaxis]), axis=2)
-            new_used_bricks_grid = np.concatenate((layer_handler.used_bricks_grid, new_layer[:, :, np.newaxis]), axis=2)
-
-            layer_handler.voxel_grid = new_voxel_grid
-            layer_handler.components_grid = new_components_grid
-            layer_handler.used_bricks_grid = new_used_bricks_grid
-
-            added_layers.append(new_voxel_grid.shape[2] - 1)
+        # increase the height of the model to the top of the windscreen if the model is too low (all the missing layers are
+        # added at once, so every grid is only copied and stored once)
+        model_height = layer_handler.voxel_grid.shape[2]
+        added_layers = list(range(model_height, windscreen_z + windscreen.height + 1))
+
+        if added_layers:
+            # the extended grids are only used through the layer_handler (a file-backed grid is a copy of the assigned one)
+            layer_handler.voxel_grid = extend_layers(layer_handler.voxel_grid, len(added_layers))
+            layer_handler.components_grid = extend_layers(layer_handler.components_grid, len(added_layers))
+            layer_handler.used_bricks_grid = extend_layers(layer_handler.used_bricks_grid, len(added_layers))
         
         # update the height of the voxel_grid
         layer_handler.z_size = layer_handler.voxel_grid.shape[2]
@@ -219,7 +346,7 @@ def spawn_windscreen(windscreen, layer_handler, main_model_material, cabin_lengt
                     layer_handler.update_components_grid_index(windscreen_x + x_added, windscreen_y - y_added, z, Components.cabin.value)
 
             
-    cabin_voxels = np.argwhere(layer_handler.components_grid == Components.cabin.value)
+    cabin_voxels = voxel_indices(layer_handler.components_grid, lambda components: components == Components.cabin.value)
 
     x_coordinates = cabin_voxels[:, 0]
     y_coordinates = cabin_voxels[:, 1]
@@ -365,106 +492,71 @@ def spawn_pin(wheel_center, voxel_grid, filename):
     other_collection.objects.link(imported_object)
 
 # returns the shared subgrid between the two removed bricks, an empty grid of equal size and a mapping grid that converts
-# local subgrid indices to global voxel_grid coordinates
-def find_connection_points(disconnected_brick_id, neighboring_brick_id, used_bricks_grid):
-    # get all the voxels of the two bricks from the global bricks grid
-    disconnected_brick_voxels = np.argwhere(used_bricks_grid == disconnected_brick_id)
-    neighboring_brick_voxels = np.argwhere(used_bricks_grid == neighboring_brick_id)
-
-    aligned_voxels = set()
-
-    for d in disconnected_brick_voxels:
-        for n in neighboring_brick_voxels:
-            # check if the bricks are alligned along the X or Y axis and that they have the same Z axis position
-            if ((d[0] == n[0] or d[1] == n[1]) and d[2] == n[2]):
-                # add all the voxels in a straight line if you would draw one through the neighbouring voxels of the two bricks
-                # X axis
-                if d[0] == n[0]:
-                    aligned_voxels.update(
-                        tuple(v) for v in disconnected_brick_voxels if v[0] == d[0] and v[2] == d[2]
-                    )
-                    aligned_voxels.update(
-                        tuple(v) for v in neighboring_brick_voxels if v[0] == n[0] and v[2] == n[2]
-                    )
-                # Y axis
-                elif d[1] == n[1]:
-                    aligned_voxels.update(
-                        tuple(v) for v in disconnected_brick_voxels if v[1] == d[1] and v[2] == d[2]
-                    )
-                    aligned_voxels.update(
-                        tuple(v) for v in neighboring_brick_voxels if v[1] == n[1] and v[2] == n[2]
-                    )
-
-    # convert to a list
-    aligned_voxels = np.array(list(aligned_voxels))
+# returns the subgrid around the aligned voxels of the two bricks where a brick can connect them
+# (brick IDs of the subgrid voxels, empty voxels of the two bricks and the global index of the first subgrid voxel)
+def find_connection_points(disconnected_brick_id, neighboring_brick_id, layer_handler):
+    used_bricks_grid = layer_handler.used_bricks_grid
+
+    # get all the voxels of the two bricks from the brick index
+    disconnected_brick_voxels = layer_handler.brick_voxel_indices(disconnected_brick_id)
+    neighboring_brick_voxels = layer_handler.brick_voxel_indices(neighboring_brick_id)
+
+    # voxel pairs of the two bricks with the same Z axis position that are alligned along the X (or otherwise the Y) axis
+    same_z = disconnected_brick_voxels[:, np.newaxis, 2] == neighboring_brick_voxels[np.newaxis, :, 2]
+    same_x = same_z & (disconnected_brick_voxels[:, np.newaxis, 0] == neighboring_brick_voxels[np.newaxis, :, 0])
+    same_y = same_z & ~same_x & (disconnected_brick_voxels[:, np.newaxis, 1] == neighboring_brick_voxels[np.newaxis, :, 1])
+
+    # all the voxels of both bricks in a straight line drawn through the alligned voxel pairs
+    brick_voxels = np.concatenate((disconnected_brick_voxels, neighboring_brick_voxels))
+    aligned = np.zeros(len(brick_voxels), dtype=bool)
+
+    for aligned_pairs, axis in ((same_x, 0), (same_y, 1)):
+        line_keys = disconnected_brick_voxels[aligned_pairs.any(axis=1)][:, [axis, 2]]
+        aligned |= (brick_voxels[:, np.newaxis, [axis, 2]] == line_keys[np.newaxis]).all(axis=2).any(axis=1)
+
+    aligned_voxels = brick_voxels[aligned]
 
     if aligned_voxels.size > 0:
-        x_min, y_min, z_min = aligned_voxels.min(axis=0)
-        x_max, y_max, z_max = aligned_voxels.max(axis=0)
+        subgrid_start = aligned_voxels.min(axis=0)
+        subgrid_end = aligned_voxels.max(axis=0) + 1
     else:
-        x_min = 0
-        y_min = 0
-        z_min = 0
-        x_max = 0
-        y_max = 0
-        z_max = 0
-
-    global_locations_subgrid = []
-
-    # get the ids of the brick that occupy the voxel and the voxel's global indices (in tuples)
-    for x in range(x_min, x_max + 1):
-        for y in range(y_min, y_max + 1):
-            for z in range(z_min, z_max + 1):
-                if used_bricks_grid[x, y, z] != 0:
-                    brick_id = used_bricks_grid[x, y, z]
-                    voxel_indices = (x, y, z)
-                    global_locations_subgrid.append((brick_id, voxel_indices))
-
-    # create an empty grid of the same size (will be used in the convolution)
-    empty_subgrid = np.ones((x_max - x_min + 1, y_max - y_min + 1, z_max - z_min + 1), dtype=int)
-
-    # create a mapping subgrid to map the local empty_subgrid indices returned from convolution to the global voxel_grid
-    mapping_subgrid = np.empty_like(empty_subgrid, dtype=object)
-
-    for local_x, global_x in enumerate(range(x_min, x_max + 1)):
-        for local_y, global_y in enumerate(range(y_min, y_max + 1)):
-            for local_z, global_z in enumerate(range(z_min, z_max + 1)):
-                mapping_subgrid[local_x, local_y, local_z] = (global_x, global_y, global_z)
-
-
-    return global_locations_subgrid, empty_subgrid, mapping_subgrid
-
-# returns all unique subgraphs (set of bricks) of bricks in the model
-def find_brick_connection_subgraphs(used_bricks):
-    visited_bricks = set()
-    connected_subgraphs = []
-
-    # depth-first search through the brick connections
-    def dfs(brick, subgraph):
-        visited_bricks.add(brick)
-        subgraph.add(brick)
-    
-        # iterate and run dfs on all the brick's connected bricks
-        for connected_brick in used_bricks[brick].connected_bricks:
-            if connected_brick not in visited_bricks:
-                dfs(connected_brick, subgraph)
+        subgrid_start = np.zeros(3, dtype=int)
+        subgrid_end = np.ones(3, dtype=int)
 
-    # run dfs() for all unvisited bricks
-    for brick in used_bricks:
-        if brick not in visited_bricks:
-            subgraph = set()
-            dfs(brick, subgraph)
-            connected_subgraphs.append(subgraph)
+    subgrid_slices = tuple(slice(start, end) for start, end in zip(subgrid_start, subgrid_end))
 
-    return connected_subgraphs
+    # the IDs of the bricks that occupy the voxels of the subgrid
+    brick_ids_subgrid = used_bricks_grid[subgrid_slices].copy()
+
+    # only the voxels of the two bricks become empty for the convolution (the rest of the subgrid is taken or outside of the model)
+    empty_subgrid = np.isin(brick_ids_subgrid, (disconnected_brick_id, neighboring_brick_id)).astype(occupancy_dtype)
+
+    # local subgrid indices are mapped to the global voxel_grid by adding the index of the first subgrid voxel
+    return brick_ids_subgrid, empty_subgrid, tuple(int(start) for start in subgrid_start)
+
+# returns the IDs of the bricks next to the voxels in the direction (0 outside of the grid)
+def gather_neighbour_ids(used_bricks_grid, voxels, direction):
+    neighbours = voxels + direction
+    inside = np.all((neighbours >= 0) & (neighbours < used_bricks_grid.shape), axis=1)
+
+    neighbour_ids = np.zeros(len(voxels), dtype=np.int64)
+    neighbour_ids[inside] = used_bricks_grid[neighbours[inside, 0], neighbours[inside, 1], neighbours[inside, 2]]
+
+    return neighbour_ids.tolist()
 
 # adds the bricks connected and neighboring bricks to the correct lists
 def determine_connected_bricks(layer_handler, used_brick, sloped=False):
-    used_brick_indices = np.where(layer_handler.used_bricks_grid == used_brick.id)
+    used_brick_voxels = layer_handler.brick_voxel_indices(used_brick.id)
+    used_brick_indices = used_brick_voxels.T
 
     used_bricks = layer_handler.used_bricks
     used_bricks_grid = layer_handler.used_bricks_grid
 
+    # IDs of the bricks next to every voxel of the used brick in every direction (read with one gather per direction)
+    above_ids, below_ids, right_ids, left_ids, infront_ids, behind_ids = (
+        gather_neighbour_ids(used_bricks_grid, used_brick_voxels, direction)
+        for direction in ((0, 0, 1), (0, 0, -1), (1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0)))
+
     # check if any brick is connected to the used brick (for each voxel of the used brick)
     for layer in range(len(used_brick_indices[0])):
         x = used_brick_indices[0][layer]
@@ -475,7 +567,7 @@ def determine_connected_bricks(layer_handler, used_brick, sloped=False):
         if not sloped:
             # check for connected bricks above the added brick (within model bounds)
             if z + 1 < used_bricks_grid.shape[2]:
-                above_id = used_bricks_grid[x, y, z + 1]
+                above_id = above_ids[layer]
 
                 # the brick cannot be nonexistent or the same brick (for thick bricks)
                 if above_id != 0 and above_id != used_brick.id:
@@ -483,10 +575,12 @@ def determine_connected_bricks(layer_handler, used_brick, sloped=False):
                     # add the brick to the connected bricks
                     if above_id in used_bricks:
                         used_bricks[above_id].connected_bricks.add(used_brick.id)
+
+                    layer_handler.connectivity.connect(used_brick.id, int(above_id))
                     
         # check for connected bricks below the added brick (within model bounds)
         if z - 1 >= 0:
-            below_id = used_bricks_grid[x, y, z - 1]
+            below_id = below_ids[layer]
 
             # the brick cannot be nonexistent or the same brick (for thick bricks)
             if below_id != 0 and below_id != used_brick.id:
@@ -495,10 +589,12 @@ def determine_connected_bricks(layer_handler, used_brick, sloped=False):
                 if below_id in used_bricks:
                     used_bricks[below_id].connected_bricks.add(used_brick.id)
 
+                layer_handler.connectivity.connect(used_brick.id, int(below_id))
+
         ### DETERMINES NEIGHBOURING BRICKS ###
         # check for neighbouring bricks above the added brick (within model bounds)
         if x + 1 < used_bricks_grid.shape[0]:
-            right_id = used_bricks_grid[x + 1, y, z]
+            right_id = right_ids[layer]
 
             # the brick cannot be nonexistent or the same brick (for thick bricks)
             if right_id != 0 and right_id != used_brick.id:
@@ -509,7 +605,7 @@ def determine_connected_bricks(layer_handler, used_brick, sloped=False):
                     
         # check for neighbouring bricks below the added brick (within model bounds)
         if x - 1 >= 0:
-            left_id = used_bricks_grid[x - 1, y, z]
+            left_id = left_ids[layer]
 
             # the brick cannot be nonexistent or the same brick (for thick bricks)
             if left_id != 0 and left_id != used_brick.id:
@@ -520,7 +616,7 @@ def determine_connected_bricks(layer_handler, used_brick, sloped=False):
 
         # check for neighbouring bricks infront of the added brick (within model bounds)
         if y + 1 < used_bricks_grid.shape[1]:
-            infront_id = used_bricks_grid[x, y + 1, z]
+            infront_id = infront_ids[layer]
 
             # the brick cannot be nonexistent or the same brick
             if infront_id != 0 and infront_id != used_brick.id:
@@ -531,7 +627,7 @@ def determine_connected_bricks(layer_handler, used_brick, sloped=False):
                     
         # check for neighbouring bricks behind the added brick (within model bounds)
         if y - 1 >= 0:
-            behind_id = used_bricks_grid[x, y - 1, z]
+            behind_id = behind_ids[layer]
 
             # the brick cannot be nonexistent or the same brick
             if behind_id != 0 and behind_id != used_brick.id:
@@ -540,16 +636,35 @@ def determine_connected_bricks(layer_handler, used_brick, sloped=False):
                 if behind_id in used_bricks:
                     used_bricks[behind_id].neighbouring_bricks.add(used_brick.id)
 
+# adds the connected and neighbouring bricks of many added bricks in one pass (same sets as determine_connected_bricks for each brick)
+def determine_connected_bricks_batch(layer_handler, added_bricks):
+    used_bricks = layer_handler.used_bricks
+    added_ids = np.array([added_brick.id for added_brick in added_bricks])
+
+    # bricks touching on the Z axis are connected, bricks touching on the X or Y axis are neighbouring
+    connected_pairs, neighbouring_pairs = Connectivity.brick_adjacency_pairs(layer_handler.used_bricks_grid, added_ids)
+
+    for touching_pairs, connected in ((connected_pairs, True), (neighbouring_pairs, False)):
+        for first_id, second_id in touching_pairs.tolist():
+            if connected:
+                layer_handler.connectivity.connect(first_id, second_id)
+
+            for brick_id, other_id in ((first_id, second_id), (second_id, first_id)):
+                if brick_id not in used_bricks:
+                    continue
+
+                if connected:
+                    used_bricks[brick_id].connected_bricks.add(other_id)
+                else:
+                    used_bricks[brick_id].neighbouring_bricks.add(other_id)
+
 # checks if a brick has the correct material (color) depending on what component of the car it should represents
 def check_materials(layer_handler, materials, main_model_material):
     for brick_id, brick_reference in layer_handler.used_bricks.items():
-        used_brick_indices = np.argwhere(layer_handler.used_bricks_grid == brick_id)
+        used_brick_indices = layer_handler.brick_voxel_indices(brick_id)
 
         # check how many components the brick represents
-        components = set()
-
-        for x, y, z in used_brick_indices:
-            components.add(layer_handler.components_grid[x, y, z])
+        components = set(layer_handler.components_grid[used_brick_indices[:, 0], used_brick_indices[:, 1], used_brick_indices[:, 2]].tolist())
 
         # if the brick stretches over multiple components don't change it's material
         if len(components) > 1:
@@ -583,19 +698,13 @@ def delete_default_objects():
             bpy.data.objects.remove(obj, do_unlink=True)
 
 # moves the 3D model to the origin point of the scene
-def move_main_object_to_starting_point(voxel_grid):
+def move_main_object_to_starting_point(voxel_grid=None):
     # get the main (currently the only) object in the scene (the car model)
     obj = bpy.context.scene.objects[0]
 
     # find all the objects (including children of the main object) in the scene 
     objects_to_check = [obj] + list(obj.children_recursive)
 
-    # find the min x, y and z values of the voxel_grid
-    voxel_grid_indices = np.argwhere(voxel_grid == 1)
-
-    min_x_voxel, min_y_voxel, min_z_voxel = voxel_grid_indices.min(axis=0)
-    max_x_voxel, max_y_voxel, max_z_voxel = voxel_grid_indices.max(axis=0)
-
     # initialize the min x, y and z values of the car model
     min_x_model, min_y_model, min_z_model = float('inf'), float('inf'), float('inf')
     max_x_model, max_y_model, max_z_model = float('-inf'), float('-inf'), float('-inf')
@@ -632,6 +741,16 @@ def move_main_object_to_starting_point(voxel_grid):
     # apply the scale
     bpy.ops.object.transform_apply()
 
+    # the model voxelized from its mesh is already aligned with its voxel_grid
+    if voxel_grid is None:
+        return
+
+    # find the min x, y and z values of the voxel_grid
+    voxel_grid_indices = np.argwhere(voxel_grid == 1)
+
+    min_x_voxel, min_y_voxel, min_z_voxel = voxel_grid_indices.min(axis=0)
+    max_x_voxel, max_y_voxel, max_z_voxel = voxel_grid_indices.max(axis=0)
+
     # find the min and max x, y and z values in the scaled car model
     for object in objects_to_check:
         if object.type == 'MESH':
@@ -690,20 +809,60 @@ def voxelize_model():
     # g_class_rescaled.binvox
     # rs4_rescaled.binvox
 
-    # load the .binvox file
-    with open("car_models/r8_rescaled.binvox", "rb") as f:
-        model = binvox_rw.read_as_3d_array(f)
+    # load the (memory-mapped) .binvox file, its X axis is the Z axis of the voxel_grid
+    model = binvox_rw.read_as_working_array("car_models/r8_rescaled.binvox", occupancy_dtype)
+
+    # access the voxel data in the (x, y, z) order of the voxel_grid (the transposed view keeps the Z layers contiguous)
+    return np.transpose(model.data, (2, 1, 0))
+
+# returns the world space vertices and the triangles (vertex indices) of the mesh object
+def mesh_object_arrays(obj):
+    mesh = obj.data
+    mesh.calc_loop_triangles()
+
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", vertices)
+    vertices = vertices.reshape(-1, 3)
+
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int32)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
 
-    # access the voxel data
-    return model.data
+    # transform the vertices to the world space
+    matrix_world = np.array(obj.matrix_world, dtype=np.float64)
+    vertices = vertices @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+
+    return vertices, triangles.reshape(-1, 3)
+
+# voxelizes the loaded (and moved) car model and its components from their meshes in one pass
+# returns the voxel_grid (components voxels are emptied like in check_each_voxel) and the components_grid
+def voxelize_loaded_model():
+    obj = bpy.context.scene.objects[0]
+
+    model_arrays = mesh_object_arrays(obj) if obj.type == 'MESH' else (np.empty((0, 3)), np.empty((0, 3), dtype=np.int32))
+    components = [(Components[component.name].value, *mesh_object_arrays(component))
+                  for component in obj.children_recursive if component.type == 'MESH']
+
+    # the grid contains all the meshes (the model starts at (0, 0, 0))
+    all_vertices = np.concatenate([model_arrays[0]] + [component[1] for component in components])
+    grid_shape = Voxelizer.mesh_grid_shape(all_vertices)
+
+    voxel_grid, components_grid = Voxelizer.voxelize_model(*model_arrays, components, grid_shape)
+    voxel_grid, components_grid = layer_contiguous(voxel_grid, occupancy_dtype), layer_contiguous(components_grid, component_dtype)
+    print(f"NUMBER OF EMPTIED VOXELS TO ACCOMMODATE CAR COMPONENTS: {np.count_nonzero(voxel_grid != components_grid)}")
+
+    return voxel_grid, components_grid
 
 # returns potential spawn positions for the brick
-def apply_correlation(voxel_grid, brick):
+def apply_correlation(voxel_grid, brick, backend=FitBackend.CORRELATION):
+    # other backends return the same positions without running the correlation
+    if backend != FitBackend.CORRELATION:
+        return np.argwhere(FitEngine.calculate_fit_grid(voxel_grid, brick.brick_kernel, brick.kernel_origin, backend))
+
     # create a kernel based on the brick dimensions
     kernel = brick.brick_kernel
 
     # correlate
-    correlation_grid = scipy.ndimage.correlate(voxel_grid, kernel, mode='constant', cval=0, origin=brick.kernel_origin)
+    correlation_grid = scipy.ndimage.correlate(voxel_grid, kernel, output=np.int32, mode='constant', cval=0, origin=brick.kernel_origin)
 
     # identify the available positions for the brick
     kernel_sum = kernel.sum()
@@ -712,12 +871,17 @@ def apply_correlation(voxel_grid, brick):
     return fitting_positions
 
 # returns potential spawn positions for the irregular brick
-def apply_convolution(voxel_grid, brick):
+def apply_convolution(voxel_grid, brick, backend=FitBackend.CORRELATION):
+    # other backends return the same positions without running the convolution
+    if backend != FitBackend.CORRELATION:
+        kernel, origin = FitEngine.convolution_as_correlation(brick.brick_kernel, brick.kernel_origin)
+        return np.argwhere(FitEngine.calculate_fit_grid(voxel_grid, kernel, origin, backend))
+
     # create a kernel based on the brick dimensions
     kernel = brick.brick_kernel
 
     # convolve
-    convolved_grid = scipy.ndimage.convolve(voxel_grid, kernel, mode='constant', cval=0, origin=brick.kernel_origin)
+    convolved_grid = scipy.ndimage.convolve(voxel_grid, kernel, output=np.int32, mode='constant', cval=0, origin=brick.kernel_origin)
 
     # identify the available positions for the brick
     kernel_sum = kernel.sum()
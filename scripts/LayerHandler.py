@@ -1,43 +1,230 @@
+import os
 import numpy as np
+from FitEngine import pack_voxel_grid, kernel_voxel_indices, kernel_voxel_offsets
+from Connectivity import ConnectivityTracker
+from ChunkedGrid import ChunkedGrid
+
+# types of the grids (the voxel_grid only holds 0 and 1, there are less than 256 car components)
+occupancy_dtype = np.uint8
+component_dtype = np.uint8
+
+# returns the smallest type of the used_bricks_grid that can hold the brick ID
+def brick_id_dtype(max_brick_id):
+    return np.uint16 if max_brick_id <= np.iinfo(np.uint16).max else np.uint32
+
+# returns the grid converted to the type with the Z layers contiguous in memory (Fortran order of the (x, y, z) indices)
+# so the layers sliced by next_layer are single blocks of memory (no copy if the grid already is stored like that)
+def layer_contiguous(grid, dtype):
+    return np.asfortranarray(grid, dtype=dtype)
+
+# returns an empty grid of the type with the Z layers contiguous in memory
+def empty_layer_grid(shape, dtype):
+    return np.zeros(shape, dtype=dtype, order='F')
+
+# returns a copy of the grid with empty layers added on top (same type and memory layout)
+def extend_layers(grid, layer_count):
+    if isinstance(grid, ChunkedGrid):
+        return grid.extend_layers(layer_count)
+
+    extended_grid = empty_layer_grid((grid.shape[0], grid.shape[1], grid.shape[2] + layer_count), grid.dtype)
+    extended_grid[:, :, :grid.shape[2]] = grid
+
+    return extended_grid
+
+# returns the mask of the voxels of the grid whose values pass the test (a function of a value array), a chunked grid is
+# tested chunk by chunk without a dense copy
+def voxel_mask(grid, test):
+    if isinstance(grid, ChunkedGrid):
+        return grid.voxel_mask(test)
+
+    return test(grid)
+
+# returns the indices of the voxels of the grid whose values pass the test (same as np.argwhere, the test has to fail for
+# zeros), a chunked grid is only searched in its occupied chunks
+def voxel_indices(grid, test):
+    if isinstance(grid, ChunkedGrid):
+        return grid.voxel_indices(test)
+
+    return np.argwhere(test(grid))
+
+# returns the grid copied into a new memory-mapped .npy file (with the Z layers contiguous in the file)
+def file_backed_grid(grid, path):
+    file_grid = np.lib.format.open_memmap(path, mode='w+', dtype=grid.dtype, shape=grid.shape, fortran_order=True)
+    file_grid[...] = grid
+
+    return file_grid
 
 class LayerSlicer:
-    def __init__(self, voxel_grid, components_grid, layer_size):
-        self.voxel_grid = voxel_grid
-        self.components_grid = components_grid 
+    def __init__(self, voxel_grid, components_grid, layer_size, packed=False, chunked=False, scratch_directory=None):
+        self.packed = packed # keep a bit-packed copy of the voxel_grid for the BIT_PACKED fit backend
+        self.packed_grid = None
+        self.scratch_directory = scratch_directory # directory of the .npy files that back the grids (None = grids in memory)
+        self.grid_files = {} # current file of every file-backed grid (key: grid name)
+        self.grid_generations = {} # number of files created for every file-backed grid (key: grid name)
+
+        if scratch_directory is not None:
+            os.makedirs(scratch_directory, exist_ok=True)
+
+        self.voxel_grid = layer_contiguous(voxel_grid, occupancy_dtype)
         self.used_bricks = {} # all the used bricks (key: id, value: brick)
-        self.used_bricks_grid = np.zeros(voxel_grid.shape, dtype=np.int32)
+
+        # the components_grid and the used_bricks_grid (widened when the brick IDs outgrow it) are only allocated in the chunks
+        # around the model if they are chunked
+        if chunked:
+            self.components_grid = ChunkedGrid.from_dense(layer_contiguous(components_grid, component_dtype))
+            self.used_bricks_grid = ChunkedGrid(voxel_grid.shape, brick_id_dtype(0))
+        else:
+            self.components_grid = layer_contiguous(components_grid, component_dtype)
+            self.used_bricks_grid = empty_layer_grid(voxel_grid.shape, brick_id_dtype(0))
+        self.brick_index = {} # start position and voxel offsets of every brick written into the used_bricks_grid (key: id)
+        self.connectivity = ConnectivityTracker() # connected components of the used bricks (updated on every placement and removal)
         self.layer_size = layer_size
         self.z_size = voxel_grid.shape[2]
         self.current_layer_start = 0
         self.current_layer = 0
+        self.region = None # (X, Y, Z) slices of the box the layers are restricted to (None = whole layers)
+        self.fit_maps = [] # fit maps that are notified whenever voxels of the voxel_grid change
     
+    # the global voxel_grid (1 = empty model voxel that still needs a brick, 0 = filled or outside of the model)
+    @property
+    def voxel_grid(self):
+        return self._voxel_grid
+
+    # replaces the global voxel_grid and repacks the packed grid (used when the grid is extended or copied)
+    @voxel_grid.setter
+    def voxel_grid(self, voxel_grid):
+        self._voxel_grid = self.store_grid("voxel_grid", voxel_grid)
+
+        if self.packed:
+            self.packed_grid = pack_voxel_grid(voxel_grid)
+
+    # the global components_grid (ID of the car component of every voxel, 0 = outside of the model)
+    @property
+    def components_grid(self):
+        return self._components_grid
+
+    @components_grid.setter
+    def components_grid(self, components_grid):
+        self._components_grid = self.store_grid("components_grid", components_grid)
+
+    # the global used_bricks_grid (ID of the brick that fills every voxel, 0 = no brick)
+    @property
+    def used_bricks_grid(self):
+        return self._used_bricks_grid
+
+    @used_bricks_grid.setter
+    def used_bricks_grid(self, used_bricks_grid):
+        self._used_bricks_grid = self.store_grid("used_bricks_grid", used_bricks_grid)
+
+    # returns the grid backed by a new file in the scratch directory (the grid itself without a scratch directory)
+    # every replaced grid gets a new file, so arrays that still refer to the previous grid keep their data
+    def store_grid(self, name, grid):
+        if self.scratch_directory is None or isinstance(grid, ChunkedGrid):
+            return grid
+
+        previous_path = self.grid_files.get(name)
+        generation = self.grid_generations.get(name, -1) + 1
+        self.grid_generations[name] = generation
+        path = os.path.join(self.scratch_directory, f"{name}_{generation}.npy")
+        file_grid = file_backed_grid(grid, path)
+        self.grid_files[name] = path
+
+        # the previous file can't be removed while it is still mapped on some systems (it stays in the scratch directory)
+        if previous_path is not None:
+            try:
+                os.remove(previous_path)
+            except OSError:
+                pass
+
+        return file_grid
+
+    # writes the changes of the file-backed grids to their files (a stopped run leaves its grids in the scratch directory)
+    def flush_grids(self):
+        for grid in (self.voxel_grid, self.components_grid, self.used_bricks_grid):
+            if isinstance(grid, np.memmap):
+                grid.flush()
+
+    # returns the packed grid of the layers from z_start up to (excluding) z_end (None if the packed grid isn't used)
+    # the X range can be restricted as well, the Y axis is always whole
+    def packed_layer(self, z_start, z_end, x_start=0, x_end=None):
+        if self.packed_grid is None:
+            return None
+
+        return self.packed_grid.window(slice(x_start, x_end), slice(z_start, z_end))
+
+    # attaches a fit map so it gets notified about every change of the voxel_grid
+    def add_fit_map(self, fit_map):
+        self.fit_maps.append(fit_map)
+
+    # detaches a fit map (used when the fill stage that created it is done)
+    def remove_fit_map(self, fit_map):
+        self.fit_maps.remove(fit_map)
+
+    # notifies all attached fit maps that a box of the voxel_grid has changed
+    def mark_fit_maps_dirty(self, x_pos, y_pos, z_pos, shape):
+        for fit_map in self.fit_maps:
+            fit_map.mark_dirty(x_pos, y_pos, z_pos, shape)
+
     # adds a new brick with a custom material to global used_bricks grid
     def add_used_brick(self, brick, material):
         self.used_bricks[brick.id] = brick
         brick.material = material
+        self.connectivity.add_brick(brick.id)
     
     # updates the global voxel_grid with filled voxels (used for adding new bricks to the model) 
     def update_voxel_grid(self, used_brick, x_pos, y_pos, z_pos): 
         # indices in the global voxel_grid
         self.voxel_grid[x_pos:x_pos + used_brick.length, y_pos:y_pos + used_brick.width, z_pos:z_pos + used_brick.height] = 0
 
-    # updates a whole layer of bricks and changes the global voxel_grid accordingly
-    def update_voxel_grid_layer(self, voxel_grid_layer):
+        if self.packed_grid is not None:
+            self.packed_grid.set_box(x_pos, y_pos, z_pos, (used_brick.length, used_brick.width, used_brick.height), 0)
+
+        self.mark_fit_maps_dirty(x_pos, y_pos, z_pos, (used_brick.length, used_brick.width, used_brick.height))
+
+    # updates the global voxel_grid with the filled voxels of many bricks of the same type at once
+    def update_voxel_grid_batch(self, used_brick, positions):
+        xs, ys, zs = kernel_voxel_indices(used_brick.brick_kernel, positions)
+        self.voxel_grid[xs, ys, zs] = 0
+
+        if self.packed_grid is not None:
+            self.packed_grid.set_voxels(xs, ys, zs, 0)
+
+        for x_pos, y_pos, z_pos in positions:
+            self.mark_fit_maps_dirty(x_pos, y_pos, z_pos, used_brick.brick_kernel.shape)
+
+    # updates a whole layer of bricks and changes the global voxel_grid accordingly (starting at the current layer by default)
+    # a layer of a region starts at the X and Y index of the region
+    def update_voxel_grid_layer(self, voxel_grid_layer, z_start=None, x_start=0, y_start=0):
+        if z_start is None:
+            z_start = self.current_layer_start
+
         # define the region in the global grid to be updated
-        z_start = self.current_layer_start
-        z_end = self.current_layer_start + voxel_grid_layer.shape[2]
+        x_end = x_start + voxel_grid_layer.shape[0]
+        y_end = y_start + voxel_grid_layer.shape[1]
+        z_end = z_start + voxel_grid_layer.shape[2]
 
         # Ensure we are within bounds
         if z_end > self.voxel_grid.shape[2]:
             raise ValueError("Layer exceeds the bounds of the global voxel grid.")
 
         # Update the specific layer in the global voxel grid
-        self.voxel_grid[:, :, z_start:z_end] = voxel_grid_layer
+        self.voxel_grid[x_start:x_end, y_start:y_end, z_start:z_end] = voxel_grid_layer
+
+        # packed rows are always repacked whole
+        if self.packed_grid is not None:
+            self.packed_layer(z_start, z_end, x_start, x_end).set_layer(0, self.voxel_grid[x_start:x_end, :, z_start:z_end])
+
+        self.mark_fit_maps_dirty(x_start, y_start, z_start, voxel_grid_layer.shape)
 
     # updates a specific voxel in the global voxel_grid (used when expanding the size of the cabin)
     def update_voxel_grid_index(self, x_index, y_index, z_index, filled):
         self.voxel_grid[x_index, y_index, z_index] = 0 if filled else 1
 
+        if self.packed_grid is not None:
+            self.packed_grid.set_box(x_index, y_index, z_index, (1, 1, 1), 0 if filled else 1)
+
+        self.mark_fit_maps_dirty(x_index, y_index, z_index, (1, 1, 1))
+
     # updates the global voxel_grid with filled voxels (used exclusively for adding new sloped bricks to the model)
     def update_voxel_grid_sloped(self, sloped_brick, x_pos, y_pos, z_pos):
         # get all indices that are marked as empty
@@ -51,13 +238,78 @@ class LayerSlicer:
         # mark the indices as filled
         self.voxel_grid[xs, ys, zs] = 0
 
+        if self.packed_grid is not None:
+            self.packed_grid.set_voxels(xs, ys, zs, 0)
+
+        self.mark_fit_maps_dirty(x_pos, y_pos, z_pos, sloped_brick.brick_kernel.shape)
+
+    # saves which voxels of the used_bricks_grid were written with the brick ID (ID 0 marks empty voxels and isn't indexed)
+    def index_brick_voxels(self, brick_id, position, offsets):
+        if brick_id == 0:
+            return
+
+        position = np.asarray(position, dtype=np.int64)
+
+        # a brick written more than once keeps all of its voxels (sorted like np.argwhere)
+        if brick_id in self.brick_index:
+            previous_position, previous_offsets = self.brick_index[brick_id]
+            voxels = np.unique(np.concatenate((previous_position + previous_offsets, position + offsets)), axis=0)
+            position, offsets = np.zeros(3, dtype=np.int64), voxels
+
+        self.brick_index[brick_id] = (position, offsets)
+
+    # returns the voxel indices of the brick in the used_bricks_grid (same as np.argwhere(used_bricks_grid == brick_id))
+    def brick_voxel_indices(self, brick_id):
+        # bricks that were never indexed are searched for in the whole grid
+        if brick_id not in self.brick_index:
+            return voxel_indices(self.used_bricks_grid, lambda brick_ids: brick_ids == brick_id)
+
+        position, offsets = self.brick_index[brick_id]
+        voxels = position + offsets
+
+        # skip the voxels outside of the grid and the ones that were overwritten by other bricks
+        voxels = voxels[np.all((voxels >= 0) & (voxels < self.used_bricks_grid.shape), axis=1)]
+
+        return voxels[self.used_bricks_grid[voxels[:, 0], voxels[:, 1], voxels[:, 2]] == brick_id]
+
+    # clears the voxels of the brick in the used_bricks_grid, removes it from the brick index and returns the cleared voxels
+    def remove_brick_voxels(self, brick_id):
+        voxels = self.brick_voxel_indices(brick_id)
+        self.used_bricks_grid[voxels[:, 0], voxels[:, 1], voxels[:, 2]] = 0
+        self.brick_index.pop(brick_id, None)
+
+        return voxels
+
+    # widens the type of the used_bricks_grid if the brick ID doesn't fit into it
+    def reserve_brick_id(self, brick_id):
+        if brick_id > np.iinfo(self.used_bricks_grid.dtype).max:
+            self.used_bricks_grid = self.used_bricks_grid.astype(brick_id_dtype(brick_id))
+
     # updates the global used_bricks_grid with with the added bricks ID
     def update_used_bricks_grid(self, used_brick, x_pos, y_pos, z_pos=None):
         if z_pos is None:
             z_pos = self.current_layer_start
 
+        self.reserve_brick_id(used_brick.id)
+
         self.used_bricks_grid[x_pos:x_pos + used_brick.length, y_pos:y_pos + used_brick.width, z_pos:z_pos + used_brick.height] = used_brick.id
 
+        box_kernel = np.ones((used_brick.length, used_brick.width, used_brick.height), dtype=np.int8)
+        self.index_brick_voxels(used_brick.id, (x_pos, y_pos, z_pos), kernel_voxel_offsets(box_kernel))
+
+    # updates the global used_bricks_grid with the IDs of many added bricks of the same type at once
+    def update_used_bricks_grid_batch(self, used_bricks, positions):
+        kernel = used_bricks[0].brick_kernel
+        xs, ys, zs = kernel_voxel_indices(kernel, positions)
+
+        # every brick ID is repeated for all voxels of its kernel
+        brick_ids = np.repeat([used_brick.id for used_brick in used_bricks], np.count_nonzero(kernel))
+        self.reserve_brick_id(max(used_brick.id for used_brick in used_bricks))
+        self.used_bricks_grid[xs, ys, zs] = brick_ids
+
+        for used_brick, position in zip(used_bricks, positions):
+            self.index_brick_voxels(used_brick.id, position, kernel_voxel_offsets(kernel))
+
     # updates the global used_bricks_grid with with the added brick IDs (used exclusively for sloped bricks)
     def update_used_bricks_grid_sloped(self, sloped_brick, x_pos, y_pos, z_pos):
         # get all indices that are marked as empty
@@ -69,24 +321,37 @@ class LayerSlicer:
         zs = z_pos + dzs
 
         # mark the indices with the bricks ID
+        self.reserve_brick_id(sloped_brick.id)
         self.used_bricks_grid[xs, ys, zs] = sloped_brick.id
 
+        self.index_brick_voxels(sloped_brick.id, (x_pos, y_pos, z_pos), kernel_voxel_offsets(sloped_brick.brick_kernel))
+
     # marks voxels in the global component_grid as empty/filed (used when expanding the size of the cabin)
     def update_components_grid_index(self, x_index, y_index, z_index, value):
         self.components_grid[x_index, y_index, z_index] = value
 
-    # returns the next layer of the global voxel_grid (depending on the layer size)
+    # returns the X and Y index of the first voxel of the layers in the global voxel_grid
+    def layer_origin(self):
+        if self.region is None:
+            return 0, 0
+
+        return self.region[0].start, self.region[1].start
+
+    # returns the next layer of the global voxel_grid (depending on the layer size and the region)
     def next_layer(self):
-        # check if there are no more layers
-        if self.current_layer >= self.z_size:
+        # check if there are no more layers (in the region)
+        if self.current_layer >= (self.z_size if self.region is None else self.region[2].stop):
             return None 
 
         # calculate the indices of the layer
         z_start = self.current_layer
         z_end = min(self.current_layer + self.layer_size, self.z_size)
 
-        # slice the layer out of the model
-        current_layers = self.voxel_grid[:, :, z_start:z_end]
+        # slice the layer out of the model (only the X and Y range of the region)
+        if self.region is None:
+            current_layers = self.voxel_grid[:, :, z_start:z_end]
+        else:
+            current_layers = self.voxel_grid[self.region[0], self.region[1], z_start:z_end]
 
         # update the current layer
         self.current_layer = z_end
@@ -101,7 +366,10 @@ class LayerSlicer:
         self.layer_size = layer_size
 
     # resets the current layer back to the lowest one (used after completing a pass of adding new bricks across all layers)
-    def reset_layers(self, layer_size):
+    # with a region only the layers overlapping it are returned (they keep the same Z bounds as without the region)
+    def reset_layers(self, layer_size, region=None):
         self.layer_size = layer_size
-        self.current_layer_start = 0
-        self.current_layer = 0
\ No newline at end of file
+        self.region = region
+        first_layer = 0 if region is None else region[2].start - region[2].start % layer_size
+        self.current_layer_start = first_layer
+        self.current_layer = first_layer
\ No newline at end of file
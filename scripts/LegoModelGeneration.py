@@ -7,8 +7,13 @@ import random
 from Brick import Brick, Wheel, Color, BrickType, Smooth, Material, Windscreen
 from Brick import Orientation, SlopedOrientation
 import HelperFunctions
-from HelperFunctions import Components
-from LayerHandler import LayerSlicer
+from HelperFunctions import Components, ComponentMapping, InteriorFill
+from LayerHandler import LayerSlicer, occupancy_dtype, layer_contiguous, voxel_mask
+from BrickCatalog import BrickCatalog, area_priority
+import FitEngine
+import ParallelFill
+import ChunkedGrid
+from FitEngine import FitMap, FitBackend
 
 # remove the default objects in Blender
 HelperFunctions.delete_default_objects()
@@ -108,6 +113,12 @@ wheel_bricks = {
     "wheel_49x28": Wheel(49, 28, "wheel_tire(49x28).glb"),
     "wheel_56x28": Wheel(56, 28, "wheel_tire(56x28).glb"),
 }
+
+# immutable catalogs with every orientation of the bricks (the bricks in the dictionaries are never rotated)
+thin_catalog = BrickCatalog(thin_bricks)
+thick_catalog = BrickCatalog(thick_bricks)
+smooth_catalog = BrickCatalog(smooth_bricks)
+sloped_catalog = BrickCatalog(sloped_bricks)
 # endregion
 
 materials = {
@@ -136,31 +147,95 @@ materials = {
 # body color of the car
 main_model_material = materials["matte_blue"]
 
+# backend used to find the fitting positions of the bricks (all backends return the same positions)
+fit_backend = FitBackend.BIT_PACKED
+
+# finds the fitting positions of the large rectangular bricks on a min-pooled occupancy pyramid of the grid (2x and 4x in X and Y)
+# and only checks those on the full resolution grid (same positions, not used with the BIT_PACKED backend)
+coarse_to_fine_placement = False
+
+# places a maximal set of non-overlapping bricks per fit map query instead of a single brick (or a mirrored pair)
+batch_placement = False
+
+# fills the layers of the thick and thin passes in a process pool (the random placements differ from the sequential fill)
+parallel_fill = False
+
+# number of worker processes for the parallel fill (None = one per CPU core)
+parallel_workers = None
+
+# maps the voxels to the car components with rays from every voxel (RAY_CAST) or with one ray per column (SCANLINE, faster,
+# but the voxels on the surface of a component can be mapped differently)
+component_mapping = ComponentMapping.RAY_CAST
+
+# repairs a brick pair of every disconnected subgraph per round of the connectivity fix instead of a single pair
+batch_connectivity_repair = False
+
+# voxel islands detached from the model that are smaller than this (in voxels) are removed before the bricks are placed
+minimum_island_size = 8
+
+# voxelizes the loaded model and its components from their meshes instead of reading the .binvox file
+# (the components_grid is created in the same pass, so component_mapping isn't used)
+mesh_voxelization = False
+
+# stores the components_grid and the used_bricks_grid in chunks that are only allocated around the model and only searches
+# the chunks with empty voxels for fitting bricks (for high resolution models that are mostly empty space)
+chunked_storage = False
+
+# leaves the interior of the model empty or fills it with the biggest plates only, so only the shell gets every brick
+# (SOLID = the whole model gets bricks)
+interior_fill = InteriorFill.SOLID
+
+# thickness of the shell around the interior (X, Y and Z in voxels), the shell is two thick bricks high in Z so the bricks
+# of its layers overlap each other and connect
+shell_thickness = (2, 2, 6)
+
+# plates with at least this area (in studs) fill the interior (InteriorFill.PLATES)
+interior_plate_area = 64
+
+# directory where the voxel_grid, components_grid and used_bricks_grid are kept in memory-mapped .npy files while the model
+# is generated (None = the grids are kept in memory), the grids stay in the directory if the run stops
+scratch_directory = None
+
 # start the timer (for time analysis of methods)
 start = time.time()
 
-# voxelize the input model
-voxel_grid = HelperFunctions.voxelize_model()
-voxel_grid = np.transpose(voxel_grid, (2, 1, 0))
-voxel_grid = voxel_grid.astype(np.int32)
+if mesh_voxelization:
+    # 2nd timer for time analysis
+    start_temp = time.time()
 
-# create a copy of the original voxel_grid
-voxel_grid_copy = voxel_grid.copy()
+    # create all collections for objects, load the 3D model and voxelize it with its components
+    HelperFunctions.create_collections()
+    HelperFunctions.load_model()
+    HelperFunctions.move_main_object_to_starting_point()
+    voxel_grid, components_grid = HelperFunctions.voxelize_loaded_model()
 
-# 2nd timer for time analysis
-start_temp = time.time()
+    # create a copy of the original voxel_grid (with the components)
+    voxel_grid_copy = layer_contiguous(components_grid != 0, occupancy_dtype)
+else:
+    # voxelize the input model
+    voxel_grid = HelperFunctions.voxelize_model()
+
+    # create a copy of the original voxel_grid (layer contiguous like the voxel_grid)
+    voxel_grid_copy = voxel_grid.copy(order='F')
+
+    # 2nd timer for time analysis
+    start_temp = time.time()
+
+    # grid to divide the model into components
+    components_grid = np.copy(voxel_grid)
+
+    # create all collections for objects, load the 3D model and adjust it to overlap the voxelization file
+    HelperFunctions.create_collections()
+    HelperFunctions.load_model()
+    HelperFunctions.move_main_object_to_starting_point(voxel_grid)
 
-# grid to divide the model into components
-components_grid = np.copy(voxel_grid)
+    # get the main (currently the only) object in the scene
+    voxel_grid, components_grid = HelperFunctions.check_each_voxel(voxel_grid, components_grid, component_mapping)
 
-# create all collections for objects, load the 3D model and adjust it to overlap the voxelization file
-HelperFunctions.create_collections()
-HelperFunctions.load_model()
-HelperFunctions.move_main_object_to_starting_point(voxel_grid)
+layer_handler = LayerSlicer(voxel_grid, components_grid, 1, fit_backend == FitBackend.BIT_PACKED, chunked_storage, scratch_directory)
 
-# get the main (currently the only) object in the scene
-voxel_grid, components_grid = HelperFunctions.check_each_voxel(voxel_grid, components_grid)
-layer_handler = LayerSlicer(voxel_grid, components_grid, 1)
+# the grids are only used through the layer_handler from here on (it keeps its own file-backed or chunked copies of them)
+del voxel_grid, components_grid
 mapping_time = time.time() - start_temp
 
 # spawn the wheels
@@ -178,10 +253,45 @@ HelperFunctions.spawn_windscreen(windscreen, layer_handler, main_model_material,
 
 # adjust the original (empty) voxel_grid for testing the sloped bricks placement 
 original_voxel_grid = HelperFunctions.adjust_original_voxel_grid(layer_handler, voxel_grid_copy)
+original_height_map = HelperFunctions.calculate_column_height_map(original_voxel_grid)
 cabin_time = time.time() - start_temp
 
-# fills the voxel_grid with bricks of different dimensions
-def fill_model_with_bricks(brick_type, material=main_model_material, exchange_orientations=False):
+# creates a fit map for the grid (or a layer/region of it) and attaches it to the layer_handler so it follows the placed bricks
+def create_fit_map(voxel_grid, z_offset=0, x_offset=0, y_offset=0):
+    backend = fit_backend
+    packed_grid = layer_handler.packed_layer(z_offset, z_offset + voxel_grid.shape[2], x_offset, x_offset + voxel_grid.shape[0])
+
+    # packed rows always hold the whole Y axis, a region with only a part of it is correlated instead
+    if backend == FitBackend.BIT_PACKED and voxel_grid.shape[1] != layer_handler.voxel_grid.shape[1]:
+        backend = FitBackend.CORRELATION
+        packed_grid = None
+
+    fit_map = FitMap(voxel_grid, z_offset, backend, packed_grid, x_offset, y_offset, ChunkedGrid.chunk_size if chunked_storage else None,
+                     coarse_to_fine_placement)
+    layer_handler.add_fit_map(fit_map)
+
+    return fit_map
+
+# spawns bricks of the same type on all the positions and updates the global grids in one vectorized update
+def place_brick_batch(brick, positions, material, smooth_brick=Smooth.NONE):
+    spawned_bricks = []
+
+    for x, y, z in positions:
+        spawned_brick = brick.spawn_brick(x, y, z, material)
+        spawned_brick.smooth_brick = smooth_brick
+        layer_handler.add_used_brick(spawned_brick, material)
+        spawned_bricks.append(spawned_brick)
+
+    layer_handler.update_used_bricks_grid_batch(spawned_bricks, positions)
+    layer_handler.update_voxel_grid_batch(brick, positions)
+
+    # check for connected bricks (the bricks of the batch see each other in the used_bricks_grid)
+    for spawned_brick in spawned_bricks:
+        HelperFunctions.determine_connected_bricks(layer_handler, spawned_brick)
+
+# fills the voxel_grid with bricks of different dimensions (only inside the region box if it is given)
+# the bricks of the catalog are used instead of the thin or thick bricks if it is given
+def fill_model_with_bricks(brick_type, material=main_model_material, exchange_orientations=False, region=None, catalog=None):
     orientation_counter = 0
 
     # reset the layer_handler to the appropriate height for the new bricks#
@@ -190,7 +300,12 @@ def fill_model_with_bricks(brick_type, material=main_model_material, exchange_or
     elif brick_type == BrickType.THICK:
         layer_height = 3
 
-    layer_handler.reset_layers(layer_height)
+    layer_handler.reset_layers(layer_height, region)
+
+    # the layers don't depend on each other, so they can all be filled at once
+    if parallel_fill and region is None:
+        fill_layers_parallel(material, exchange_orientations, catalog)
+        return
 
     while True:
         current_layer = layer_handler.next_layer()
@@ -206,49 +321,72 @@ def fill_model_with_bricks(brick_type, material=main_model_material, exchange_or
         else:
             default_orientation = Orientation.EAST_WEST
 
-        fill_with_bricks(current_layer, material, default_orientation)
+        fill_with_bricks(current_layer, material, default_orientation, catalog)
         orientation_counter += 1
 
+# fills all the layers of the layer_handler in a process pool and spawns the placed bricks afterwards (in the order of the layers)
+def fill_layers_parallel(material, exchange_orientations=False, catalog=None):
+    slabs = []
+    slab_bricks = []
+
+    while True:
+        current_layer = layer_handler.next_layer()
+
+        # break if no more layers left
+        if current_layer is None:
+            print("No more layers left. Reseting layers and proceeding to next brick.")
+            break
+
+        if exchange_orientations:
+            default_orientation = Orientation.EAST_WEST if len(slabs) % 2 == 0 else Orientation.NORTH_SOUTH
+        else:
+            default_orientation = Orientation.EAST_WEST
+
+        # every layer gets its bricks in the same order as fill_with_bricks tries them and its own random seed
+        layer_catalog = catalog if catalog is not None else thin_catalog if current_layer.shape[2] == 1 else thick_catalog
+        bricks = [brick for brick_index in layer_catalog.ordered_bricks() for brick in layer_catalog.orientation_variants(brick_index, default_orientation)]
+
+        slabs.append(ParallelFill.SlabFill(layer_handler.current_layer_start, layer_handler.current_layer_start + current_layer.shape[2],
+                                           [brick.brick_kernel for brick in bricks], [brick.kernel_origin for brick in bricks], random.getrandbits(32)))
+        slab_bricks.append(bricks)
+
+    filled_voxel_grid, slab_placements = ParallelFill.fill_layers(layer_handler.voxel_grid, slabs, fit_backend, batch_placement, parallel_workers,
+                                                                   coarse_to_fine_placement)
+
+    # spawn the placed bricks and update the used_bricks grid
+    spawned_bricks = []
+
+    for bricks, placements in zip(slab_bricks, slab_placements):
+        for brick_index, x, y, z in placements.tolist():
+            spawned_brick = bricks[brick_index].spawn_brick(x, y, z, material)
+            layer_handler.add_used_brick(spawned_brick, material)
+            layer_handler.update_used_bricks_grid(spawned_brick, x, y, z)
+            spawned_bricks.append(spawned_brick)
+
+    layer_handler.update_voxel_grid_layer(filled_voxel_grid, 0)
+
+    # check for connected bricks of all the spawned bricks at once
+    HelperFunctions.determine_connected_bricks_batch(layer_handler, spawned_bricks)
+
 # fills the voxel_grid with sloped bricks of different dimensions
-def fill_with_bricks_sloped(selected_bricks, material=main_model_material, default_orientation=SlopedOrientation.NORTH):
-    bricks = selected_bricks.copy()
-
-    while bricks:
-        # find the brick with the largest surface
-        brick = max(
-            bricks.values(),
-            key=lambda obj: (
-                min(obj.length, obj.width),  # prioritize smaller of length/width
-                max(obj.length, obj.width)  # then prioritize larger of length/width
-            )
-        )
-
-        tested_orientations = {brick.orientation}
-
-        while True:
-            # find the fitting positions for the brick
-            fitting_positions = HelperFunctions.apply_correlation(layer_handler.voxel_grid, brick)
-            filtered_positions = find_allowed_spawns(fitting_positions, brick)
-            
-            # no fitting positions found
-            if len(filtered_positions) == 0:
-                if len(tested_orientations) == len(SlopedOrientation):
-                    # reset the orientation to the default one after trying all the orientations
-                    brick.change_sloped_orientation(default_orientation)
-
-                    # delete the brick from the copied array
-                    del bricks[next(key for key, value in bricks.items() if value == brick)]
+def fill_with_bricks_sloped(catalog, material=main_model_material, default_orientation=SlopedOrientation.NORTH):
+    # keep the fitting positions of every brick orientation and only recalculate them around placed bricks
+    fit_map = create_fit_map(layer_handler.voxel_grid)
+
+    # go through the bricks from the largest surface and try each brick in all of its orientations
+    for brick_index in catalog.ordered_bricks():
+        for brick in catalog.orientation_variants(brick_index, default_orientation):
+            while True:
+                # find the fitting positions for the brick
+                fitting_positions = fit_map.apply_correlation(brick)
+                filtered_positions = find_allowed_spawns(fitting_positions, brick)
+
+                # no fitting positions found, try the next orientation
+                if len(filtered_positions) == 0:
                     break
-                else:
-                    untested_orientation = SlopedOrientation.get_untested_orientation(tested_orientations)
-
-                    if untested_orientation:
-                        # try the other orientation of the brick (if it has one) and add it the list of tried orientations
-                        brick.change_sloped_orientation(untested_orientation)
-                        tested_orientations.add(untested_orientation)
-            else:
+
                 # check if any of the fitting positions contains a mirrored position
-                bricks_to_add = check_for_symmetry(filtered_positions, layer_handler.voxel_grid, brick)
+                bricks_to_add = check_for_symmetry(filtered_positions, layer_handler.voxel_grid, brick, fit_map)
 
                 # pick a random position to place the brick if a mirrored pair was not found
                 if not bricks_to_add:
@@ -258,7 +396,7 @@ def fill_with_bricks_sloped(selected_bricks, material=main_model_material, defau
                 # add the brick to the position
                 for x, y, z in bricks_to_add:
                     spawned_brick = brick.spawn_brick(x, y, z, material)
-                    
+
                     spawned_brick.smooth_brick = Smooth.SLOPED
                     layer_handler.add_used_brick(spawned_brick, material)
 
@@ -269,49 +407,32 @@ def fill_with_bricks_sloped(selected_bricks, material=main_model_material, defau
                     # update the voxel grid
                     layer_handler.update_voxel_grid_sloped(brick, x, y, z)
 
+    layer_handler.remove_fit_map(fit_map)
+
 # fills the voxel_grid with smooth bricks of different dimensions
-def fill_model_with_bricks_smooth(selected_bricks, material=main_model_material, default_orientation=Orientation.EAST_WEST):
-    bricks = selected_bricks.copy()
-
-    while bricks:
-        # find the brick with the largest surface
-        brick = max(
-            bricks.values(),
-            key=lambda obj: (
-                min(obj.length, obj.width),  # prioritize smaller of length/width
-                max(obj.length, obj.width)  # then prioritize larger of length/width
-            )
-        )
-
-        tested_orientations = {brick.orientation}
-
-        while True:
-            # find the fitting positions for the brick
-            fitting_positions = HelperFunctions.apply_convolution(layer_handler.voxel_grid, brick)
-            filtered_positions = find_allowed_spawns(fitting_positions, brick)
-            
-            # no fitting positions found
-            if len(filtered_positions) == 0:
-                if brick.orientation == Orientation.NONE:
-                    # delete the brick from the copied array
-                    del bricks[next(key for key, value in bricks.items() if value == brick)]
+def fill_model_with_bricks_smooth(catalog, material=main_model_material, default_orientation=Orientation.EAST_WEST):
+    # keep the fitting positions of every brick orientation and only recalculate them around placed bricks
+    fit_map = create_fit_map(layer_handler.voxel_grid)
+
+    # go through the bricks from the largest surface and try each brick in all of its orientations
+    for brick_index in catalog.ordered_bricks():
+        for brick in catalog.orientation_variants(brick_index, default_orientation):
+            while True:
+                # find the fitting positions for the brick
+                fitting_positions = fit_map.apply_convolution(brick)
+                filtered_positions = find_allowed_spawns(fitting_positions, brick)
+
+                # no fitting positions found, try the next orientation
+                if len(filtered_positions) == 0:
                     break
 
-                if len(tested_orientations) == len(Orientation) - 1:
-                    # reset the orientation to the default one after trying all the orientations
-                    brick.change_orientation(default_orientation)
+                if batch_placement:
+                    # place as many non-overlapping bricks (in random order) as the fitting positions allow
+                    random.shuffle(filtered_positions)
+                    batch_positions = FitEngine.select_non_overlapping(filtered_positions, brick.brick_kernel, layer_handler.voxel_grid.shape, True)
+                    place_brick_batch(brick, batch_positions, material, Smooth.NORMAL)
+                    continue
 
-                    # delete the brick from the copied array
-                    del bricks[next(key for key, value in bricks.items() if value == brick)]
-                    break
-                else:
-                    untested_orientation = Orientation.get_untested_orientation(tested_orientations)
-
-                    if untested_orientation:
-                        # try the other orientation of the brick (if it has one) and add it the list of tried orientations
-                        brick.change_orientation(untested_orientation)
-                        tested_orientations.add(untested_orientation)
-            else:
                 # check if any of the fitting positions contains a mirrored position
                 bricks_to_add = check_for_symmetry(filtered_positions, layer_handler.voxel_grid, brick)
 
@@ -333,37 +454,44 @@ def fill_model_with_bricks_smooth(selected_bricks, material=main_model_material,
                     # update the voxel grid
                     layer_handler.update_voxel_grid(brick, x, y, z)
 
+    layer_handler.remove_fit_map(fit_map)
+
 # spawns in the bricks that represent the front and rear lights of the car
 def spawn_lights(components_grid):
-    voxel_grid_copy = np.copy(layer_handler.voxel_grid)
-
     # retrieve all light components from the model
     all_lights = [component for component in Components if "light" in component.name]
     front_lights = [light.value for light in all_lights if "front" in light.name]
     rear_lights = [light.value for light in all_lights if "rear" in light.name]
 
     # make space for the front lights in the voxel_grid
-    voxel_grid_copy[np.isin(components_grid, front_lights)] = 1
-    layer_handler.voxel_grid = voxel_grid_copy
+    front_light_voxels = voxel_mask(components_grid, lambda components: np.isin(components, front_lights))
+    layer_handler.update_voxel_grid_layer(np.where(front_light_voxels, 1, layer_handler.voxel_grid), 0)
 
-    # fill the space of the front lights
-    fill_model_with_bricks(BrickType.THICK, materials["matte_yellow"])
-    fill_model_with_bricks(BrickType.THIN, materials["matte_yellow"])
+    # fill the space of the front lights (only the box around them is filled)
+    front_lights_region = HelperFunctions.calculate_bounding_box(np.argwhere(front_light_voxels))
+    fill_model_with_bricks(BrickType.THICK, materials["matte_yellow"], region=front_lights_region)
+    fill_model_with_bricks(BrickType.THIN, materials["matte_yellow"], region=front_lights_region)
 
     # make space for the rear lights in the voxel_grid
-    voxel_grid_copy[np.isin(components_grid, rear_lights)] = 1
-    layer_handler.voxel_grid = voxel_grid_copy
+    # (marked on the live voxel_grid, so the voxels filled by the front lights stay filled)
+    rear_light_voxels = voxel_mask(components_grid, lambda components: np.isin(components, rear_lights))
+    layer_handler.update_voxel_grid_layer(np.where(rear_light_voxels, 1, layer_handler.voxel_grid), 0)
 
-    # fill the space of the front lights
-    fill_model_with_bricks(BrickType.THICK, materials["matte_red"])
-    fill_model_with_bricks(BrickType.THIN, materials["matte_red"])
+    # fill the space of the front lights (only the box around them is filled)
+    rear_lights_region = HelperFunctions.calculate_bounding_box(np.argwhere(rear_light_voxels))
+    fill_model_with_bricks(BrickType.THICK, materials["matte_red"], region=rear_lights_region)
+    fill_model_with_bricks(BrickType.THIN, materials["matte_red"], region=rear_lights_region)
 
 # checks if a placed brick has a symmetrical position (on the Y-axis) and spawns a brick there if it does
-def check_for_symmetry(fitting_positions, voxel_grid_layer, brick):
+def check_for_symmetry(fitting_positions, voxel_grid_layer, brick, fit_map=None):
     def calculate_mirrored_position(x_pos, y_pos, custom=False):
         mirrored_x = voxel_grid_layer.shape[0] - x_pos - brick.length
         return mirrored_x, y_pos
 
+    # rectangular bricks are matched with their mirrored position without spawning anything
+    if not isinstance(brick.orientation, SlopedOrientation):
+        return FitEngine.find_mirrored_positions(fitting_positions, voxel_grid_layer.shape, brick.length)
+
     bricks_to_add = []
     
     # bricks longer than half of the model cannot be mirrored
@@ -371,125 +499,85 @@ def check_for_symmetry(fitting_positions, voxel_grid_layer, brick):
         return []
 
     # if there is only one fitting position return it
-    if len(fitting_positions) == 1:# and not isinstance(brick.orientation, SlopedOrientation):
+    if len(fitting_positions) == 1:
         bricks_to_add.append((pos.item() for pos in fitting_positions[0]))
         return bricks_to_add
 
-    symmetry_line_x = voxel_grid_layer.shape[0] / 2
-    sorted_fitting_positions = sorted(fitting_positions, key=lambda pos: pos[2].item(), reverse=False)
+    if len(fitting_positions) == 0:
+        return bricks_to_add
 
-    # check all positions to find the ones that can be mirrored
-    for position in sorted_fitting_positions:
-        x_pos, y_pos, z_pos = (pos.item() for pos in position)
-        mirrored_x, mirrored_y = calculate_mirrored_position(x_pos, y_pos)
-        
-        if isinstance(brick.orientation, SlopedOrientation):
-            original_orientation = brick.orientation
-
-            # get mirrored orientation
-            if original_orientation == SlopedOrientation.NORTH:
-                mirrored_orientation = SlopedOrientation.SOUTH
-            elif original_orientation == SlopedOrientation.SOUTH:
-                mirrored_orientation = SlopedOrientation.NORTH
-            elif original_orientation == SlopedOrientation.EAST:
-                mirrored_orientation = SlopedOrientation.WEST
-            elif original_orientation == SlopedOrientation.WEST:
-                mirrored_orientation = SlopedOrientation.EAST
-
-            # calculate mirrored brick position from the original
-            original_brick_to_add = (x_pos, y_pos, z_pos)
-            custom_x, custom_y = calculate_mirrored_position(x_pos, y_pos, True)
-            
-            brick.change_sloped_orientation(mirrored_orientation)
-            
-            fitting_positions_test = HelperFunctions.apply_correlation(layer_handler.voxel_grid, brick)
-            filtered_positions_test = find_allowed_spawns(fitting_positions_test, brick)
-
-            # if mirrored position exists spawn a brick there
-            if (custom_x, custom_y, z_pos) in filtered_positions_test:
-                spawned_brick = brick.spawn_brick(custom_x, custom_y, z_pos, main_model_material)
-                spawned_brick.smooth_brick = Smooth.SLOPED
-                layer_handler.add_used_brick(spawned_brick, main_model_material)
+    # the sloped brick is always placed on the lowest position (a stable sort keeps the order of the same heights)
+    fitting_positions = np.asarray(fitting_positions).reshape(-1, 3)
+    lowest_position = fitting_positions[np.argsort(fitting_positions[:, 2], kind='stable')[0]]
+    x_pos, y_pos, z_pos = (pos.item() for pos in lowest_position)
 
-                # check for connected bricks
-                layer_handler.update_used_bricks_grid_sloped(spawned_brick, custom_x, custom_y, z_pos)
-                HelperFunctions.determine_connected_bricks(layer_handler, spawned_brick)
+    # get the brick in the mirrored orientation
+    mirrored_brick = sloped_catalog.mirrored_variant(brick)
 
-                # update the voxel grid
-                layer_handler.update_voxel_grid_sloped(brick, custom_x, custom_y, z_pos)
+    # calculate mirrored brick position from the original
+    original_brick_to_add = (x_pos, y_pos, z_pos)
+    custom_x, custom_y = calculate_mirrored_position(x_pos, y_pos, True)
 
-            brick.change_sloped_orientation(original_orientation)
+    # the fit map keeps the fit grid of the mirrored orientation between the calls (a temporary one calculates it once)
+    if fit_map is None:
+        fit_map = FitMap(layer_handler.voxel_grid, 0, fit_backend, layer_handler.packed_layer(0, layer_handler.voxel_grid.shape[2]), chunk_size=ChunkedGrid.chunk_size if chunked_storage else None)
 
-            bricks_to_add.append(original_brick_to_add)
-            return bricks_to_add
-        else:
-            # find matching mirrored position
-            mirrored_position = [
-                pos for pos in sorted_fitting_positions
-                if pos[0].item() == mirrored_x 
-                and pos[1].item() == mirrored_y
-            ]
-
-            if mirrored_position:
-                x_mirrored, y_mirrored, z_mirrored = (pos.item() for pos in mirrored_position[0])
-
-                # only return the original if the voxels of it stretch over the middle of the model
-                x_voxels_original = list(range(x_pos, x_pos + brick.length))
-    
-                if int(symmetry_line_x) in x_voxels_original:
-                    bricks_to_add.append((x_pos, y_pos, z_pos))
-                    return list(set(bricks_to_add))
-                
-                bricks_to_add.append((x_pos, y_pos, z_pos))
-                bricks_to_add.append((x_mirrored, y_mirrored, z_mirrored))
-                # set and then list to clear duplicates
-                return list(set(bricks_to_add))
-            
-            if isinstance(brick.orientation, SlopedOrientation):
-                if not mirrored_position:
-                    continue
+    mirrored_fits = fit_map.correlation_fits(mirrored_brick, custom_x, custom_y, z_pos - fit_map.z_offset)
+
+    # if mirrored position exists spawn a brick there
+    if mirrored_fits and find_allowed_spawns([(custom_x, custom_y, z_pos)], mirrored_brick):
+        spawned_brick = mirrored_brick.spawn_brick(custom_x, custom_y, z_pos, main_model_material)
+        spawned_brick.smooth_brick = Smooth.SLOPED
+        layer_handler.add_used_brick(spawned_brick, main_model_material)
+
+        # check for connected bricks
+        layer_handler.update_used_bricks_grid_sloped(spawned_brick, custom_x, custom_y, z_pos)
+        HelperFunctions.determine_connected_bricks(layer_handler, spawned_brick)
 
+        # update the voxel grid
+        layer_handler.update_voxel_grid_sloped(mirrored_brick, custom_x, custom_y, z_pos)
+
+    bricks_to_add.append(original_brick_to_add)
     return bricks_to_add
 
 # fills a layer with bricks
-def fill_with_bricks(voxel_grid_layer, material, default_orientation=Orientation.EAST_WEST):
-    # copy the appropriate bricks dictionary depending on the brick's height
-    bricks = thin_bricks.copy() if voxel_grid_layer.shape[2] == 1 else thick_bricks.copy()
-
-    while bricks:
-        # find the brick with the largest surface
-        brick = max(
-            bricks.values(),
-            key=lambda obj: (
-                min(obj.length, obj.width),  # prioritize smaller of length/width
-                max(obj.length, obj.width)  # then prioritize larger of length/width
-            )
-        )
-
-        tried_rotation = False
-
-        while True:
-            # find the fitting positions for the brick
-            fitting_positions = HelperFunctions.apply_convolution(voxel_grid_layer, brick)
-            random.shuffle(fitting_positions)
-
-            # no fitting positions found
-            if len(fitting_positions) == 0:
-                if (tried_rotation or brick.orientation == Orientation.NONE):
-                    # reset the orientation to the default one after trying all the orientations
-                    if (brick.orientation != Orientation.NONE):
-                        brick.change_orientation(default_orientation)
-
-                    # delete the brick from the copied array
-                    del bricks[next(key for key, value in bricks.items() if value == brick)]
+def fill_with_bricks(voxel_grid_layer, material, default_orientation=Orientation.EAST_WEST, catalog=None):
+    # pick the appropriate brick catalog depending on the brick's height
+    if catalog is None:
+        catalog = thin_catalog if voxel_grid_layer.shape[2] == 1 else thick_catalog
+
+    # the layer can be restricted to a region (the fitting positions are moved to the global X and Y indices)
+    x_start, y_start = layer_handler.layer_origin()
+    layer_offset = np.array([x_start, y_start, 0])
+
+    # the whole layer of the model (the bricks are still mirrored across the whole model)
+    model_layer = layer_handler.voxel_grid[:, :, layer_handler.current_layer_start:layer_handler.current_layer_start + voxel_grid_layer.shape[2]]
+
+    # keep the fitting positions of every brick orientation in the layer and only recalculate them around placed bricks
+    fit_map = create_fit_map(voxel_grid_layer, layer_handler.current_layer_start, x_start, y_start)
+
+    # go through the bricks from the largest surface and try each brick in all of its orientations
+    for brick_index in catalog.ordered_bricks():
+        for brick in catalog.orientation_variants(brick_index, default_orientation):
+            while True:
+                # find the fitting positions for the brick
+                # shuffle the rows with a permutation drawn from random (random.shuffle swaps rows through views and duplicates them)
+                fitting_positions = fit_map.apply_convolution(brick) + layer_offset
+                fitting_positions = fitting_positions[random.sample(range(len(fitting_positions)), len(fitting_positions))]
+
+                # no fitting positions found, try the next orientation
+                if len(fitting_positions) == 0:
                     break
-                else:
-                    # try the other orientation of the brick (if it has one)
-                    brick.change_orientation(Orientation.NORTH_SOUTH if default_orientation == Orientation.EAST_WEST else Orientation.EAST_WEST)
-                    tried_rotation = True
-            else:
+
+                if batch_placement:
+                    # place as many non-overlapping bricks (in the shuffled order) as the fitting positions allow
+                    batch_positions = FitEngine.select_non_overlapping(fitting_positions, brick.brick_kernel, model_layer.shape, True)
+                    batch_positions = [(x, y, z + layer_handler.current_layer_start) for x, y, z in batch_positions]
+                    place_brick_batch(brick, batch_positions, material)
+                    continue
+
                 # check if any of the fitting positions contains a mirrored position
-                bricks_to_add = check_for_symmetry(fitting_positions, voxel_grid_layer, brick)
+                bricks_to_add = check_for_symmetry(fitting_positions, model_layer, brick)
 
                 # pick a random position to place the brick if a mirrored pair was not found
                 if not bricks_to_add:
@@ -504,100 +592,66 @@ def fill_with_bricks(voxel_grid_layer, material, default_orientation=Orientation
 
                     # check for connected bricks
                     layer_handler.update_used_bricks_grid(spawned_brick, x_brick, y_brick)
-                    #layer_handler.update_used_bricks_grid(spawned_brick, x_brick, y_brick)
                     HelperFunctions.determine_connected_bricks(layer_handler, spawned_brick)
 
-                    # update the voxel grid of the layer
-                    for x in range(brick.length):
-                        for y in range(brick.width):
-                            for z in range(brick.height):
-                                voxel_grid_layer[x_brick + x][y_brick + y][z_brick + z] = 0
+                    # update the voxel grid of the layer (the layer is a view of the global voxel_grid)
+                    layer_handler.update_voxel_grid(brick, x_brick, y_brick, z_brick + layer_handler.current_layer_start)
 
-    # try the next brick
-    layer_handler.update_voxel_grid_layer(voxel_grid_layer)
+    # the layer is a view of the global voxel_grid, so the placed bricks are already in it (no copy back is needed)
+    layer_handler.remove_fit_map(fit_map)
 
 # connects two smaller subgraphs into a larger one using a "bridge" brick
-def connect_subgraphs(neighboring_bricks_subgrid, empty_subgrid, mapping_subgrid):
-    connection_bricks = thick_bricks.copy() if empty_subgrid.shape[2] == 3 else thin_bricks.copy()
+def connect_subgraphs(brick_ids_subgrid, empty_subgrid, subgrid_start):
+    catalog = thick_catalog if empty_subgrid.shape[2] == 3 else thin_catalog
 
     def check_positions(fitting_positions, brick):
-        elegible_fitting_positions = []
+        if len(fitting_positions) == 0:
+            return None
 
         # get the two brick ids that the voxel subgrid is based on
-        brick_ids = {brick_id for brick_id, _ in neighboring_bricks_subgrid}
+        brick_ids = np.unique(brick_ids_subgrid[brick_ids_subgrid != 0])
 
-        for position in fitting_positions:
-            # get the brick position indices in the empty_subgrid
-            x_pos, y_pos, z_pos = map(lambda pos: pos.item(), position)
+        if len(brick_ids) != 2:
+            print("Error: The list doesn't contain exactly two brick IDs.")
+            return None
 
-            if len(brick_ids) == 2:
-                first_brick_id, second_brick_id = brick_ids
-            else:
-                print("Error: The list doesn't contain exactly two brick IDs.")
-                continue
+        first_brick_id, second_brick_id = brick_ids
 
-            first_brick_count = 0
-            second_brick_count = 0
-
-            for x in range(brick.length):
-                for y in range(brick.width):
-                    for z in range(brick.height):
-                        temp_tuple = mapping_subgrid[x + x_pos, y + y_pos, z + z_pos]
-                        matching_voxel = [id for id, global_indices in neighboring_bricks_subgrid 
-                                          if global_indices == temp_tuple]
-                        
-                        if matching_voxel == first_brick_id:
-                            first_brick_count += 1
-                        elif matching_voxel == second_brick_id:
-                            second_brick_count += 1
-
-            # add all the positions that connect the two bricks to a list
-            if first_brick_count > 0 and second_brick_count > 0:
-                elegible_fitting_positions.append(
-                    (position, (first_brick_count, second_brick_count)))
-
-        if not elegible_fitting_positions:
+        # brick IDs under every voxel of the brick on every fitting position
+        brick_voxels = fitting_positions[:, np.newaxis, :] + FitEngine.kernel_voxel_offsets(brick.brick_kernel)
+        covered_ids = brick_ids_subgrid[brick_voxels[..., 0], brick_voxels[..., 1], brick_voxels[..., 2]]
+
+        first_brick_counts = np.count_nonzero(covered_ids == first_brick_id, axis=1)
+        second_brick_counts = np.count_nonzero(covered_ids == second_brick_id, axis=1)
+
+        # only the positions that connect the two bricks are elegible
+        elegible_positions = (first_brick_counts > 0) & (second_brick_counts > 0)
+
+        if not elegible_positions.any():
             return None
 
-        # find and return the optimal fitting position (with the most connecting voxels)
-        best_position = max(elegible_fitting_positions, key=lambda x: (x[1][0], x[1][1]))
-        x_pos, y_pos, z_pos = best_position[0]
+        # find and return the optimal fitting position (with the most connecting voxels, the first one of the same counts)
+        position_scores = np.where(elegible_positions, first_brick_counts * (covered_ids.shape[1] + 1) + second_brick_counts, -1)
+        x_pos, y_pos, z_pos = (pos.item() for pos in fitting_positions[np.argmax(position_scores)])
 
         # update and return the empty_subgrid for the next iteration of convolution
-        for x in range(brick.length):
-            for y in range(brick.width):
-                for z in range(brick.height):
-                    empty_subgrid[x + x_pos][y + y_pos][z + z_pos] = 0
-
-        return [mapping_subgrid[x_pos, y_pos, z_pos], empty_subgrid]
-
-    while connection_bricks:
-        # find the brick with the largest surface
-        brick = max(connection_bricks.values(), key=lambda obj: obj.length * obj.width)
-
-        tried_rotation = False
-
-        while (True):
-            # find the fitting positions for the brick in the subgrid
-            fitting_positions = HelperFunctions.apply_convolution(empty_subgrid, brick)
-
-            returned_items = check_positions(fitting_positions, brick)
-                
-            # no fitting positions found
-            if returned_items is None:
-                if tried_rotation or brick.orientation == Orientation.NONE:
-                    # reset the orientation to the default one after trying all the orientations
-                    if (brick.orientation != Orientation.NONE):
-                        brick.change_orientation(Orientation.EAST_WEST)
-
-                    # delete the brick from the copied array
-                    del connection_bricks[next(key for key, value in connection_bricks.items() if value == brick)]
+        empty_subgrid[x_pos:x_pos + brick.length, y_pos:y_pos + brick.width, z_pos:z_pos + brick.height] = 0
+
+        return [(x_pos + subgrid_start[0], y_pos + subgrid_start[1], z_pos + subgrid_start[2]), empty_subgrid]
+
+    # go through the bricks from the largest area and try each brick in both orientations
+    for brick_index in catalog.ordered_bricks(area_priority):
+        for brick in catalog.orientation_variants(brick_index, Orientation.EAST_WEST):
+            while (True):
+                # find the fitting positions for the brick in the subgrid
+                fitting_positions = HelperFunctions.apply_convolution(empty_subgrid, brick, fit_backend)
+
+                returned_items = check_positions(fitting_positions, brick)
+
+                # no fitting positions found, try the next orientation
+                if returned_items is None:
                     break
-                else:
-                    # try the other orientation of the brick (if it has one)
-                    brick.change_orientation(Orientation.NORTH_SOUTH)
-                    tried_rotation = True
-            else:
+
                 elegible_fitting_positions, empty_subgrid = returned_items
                 x_pos, y_pos, z_pos = elegible_fitting_positions
                 # find the optimal fitting position and spawn the brick
@@ -611,6 +665,176 @@ def connect_subgraphs(neighboring_bricks_subgrid, empty_subgrid, mapping_subgrid
                 # check for connected bricks
                 HelperFunctions.determine_connected_bricks(layer_handler, spawned_brick)
 
+# picks a random brick with at least one neighbour from the disconnected subgraphs (subgraphs with non-static bricks first)
+# the subgraphs without such a brick are removed from the list, returns the brick ID and its subgraph (None if there is none)
+def select_disconnected_brick(disconnected_subgraphs):
+    while disconnected_subgraphs:
+        non_static_subgraphs = []
+
+        # check if all disconnected subgraphs are full of static bricks
+        for disconnected_subgraph in disconnected_subgraphs:
+              if all(layer_handler.used_bricks[disconnected_brick_id].smooth_brick != Smooth.NONE for disconnected_brick_id in list(disconnected_subgraph)):
+                continue
+              else:
+                non_static_subgraphs.append(disconnected_subgraph)
+      
+        # all subgraphs contain only static bricks -> select one of them randomly
+        if non_static_subgraphs:
+            random_subgraph = random.choice(non_static_subgraphs)
+            disconnected_brick_id = random.choice(list(random_subgraph))
+        else:
+            random_subgraph = random.choice(disconnected_subgraphs)
+            disconnected_brick_id = random.choice(list(random_subgraph))
+
+        # return if found a brick with at least one neighbour
+        if layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks:
+            return disconnected_brick_id, random_subgraph
+        # remove subgraph if no valid bricks with neighbors exist
+        else:
+            disconnected_subgraphs.remove(random_subgraph)
+
+    return None, None
+
+# picks a random neighbour with the lowest z of the disconnected brick (None if it doesn't have any non-static neighbours)
+def select_neighboring_brick(disconnected_brick_id, same_bricks_counter):
+    # create a list of all neighbours and their lowest z values
+    neighbour_z_list = list()
+    
+    # if all neighbouring bricks are static, pick one randomly
+    if all(layer_handler.used_bricks[neighboring_brick].smooth_brick != Smooth.NONE for neighboring_brick in layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks):
+        neighboring_smooth_bricks = list(neighboring_brick for neighboring_brick
+                                        in layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks 
+                                        if layer_handler.used_bricks[neighboring_brick].smooth_brick == Smooth.NORMAL)
+        
+        if neighboring_smooth_bricks:
+            random_neighbouring_brick = random.choice(neighboring_smooth_bricks)
+        else:
+            random_neighbouring_brick = random.choice(list(layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks))
+
+        random_neighboring_brick_indices = layer_handler.brick_voxel_indices(random_neighbouring_brick)
+        lowest_z = min(z[2] for z in random_neighboring_brick_indices)
+        neighbour_z_list.append((random_neighbouring_brick, lowest_z))
+    else:
+        for neighboring_brick in layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks:
+            # ignore the static bricks (for components)
+            if layer_handler.used_bricks[neighboring_brick].smooth_brick != Smooth.NONE and same_bricks_counter < 100:
+                continue
+
+            neighboring_brick_indices = layer_handler.brick_voxel_indices(neighboring_brick)
+
+            if neighboring_brick_indices.size == 0:
+                print("Problematic neighbouring brick ID:" + str(neighboring_brick))
+                print("Problematic neighbouring brick indices:" + str(neighboring_brick_indices))
+                break
+
+            lowest_z = min(z[2] for z in neighboring_brick_indices)
+
+            neighbour_z_list.append((neighboring_brick, lowest_z))
+     
+    if len(neighbour_z_list) == 0:
+        return None
+    
+    # find a random neighbour with the lowest z
+    lowest_z = min(neighbour_z_list, key=lambda x: x[1])[1]
+
+    return random.choice([brick_id for brick_id, z in neighbour_z_list if z == lowest_z])
+
+# returns the box around the voxels of the bricks (the region a repair of the bricks refills)
+def calculate_repair_region(brick_ids):
+    return HelperFunctions.calculate_bounding_box(np.concatenate([layer_handler.brick_voxel_indices(brick_id) for brick_id in brick_ids]))
+
+# selects one brick pair to repair for every disconnected subgraph (the subgraphs are picked in a random order)
+# pairs that share a brick or a part of their region with an already selected pair wait for the next round
+def select_repair_pairs(disconnected_subgraphs, same_bricks_counter):
+    repair_pairs = []
+    repair_regions = []
+    repaired_bricks = set()
+
+    # only the bricks with neighbours are picked (so every subgraph with such a brick gets a repair in the round)
+    disconnected_subgraphs = [{brick_id for brick_id in subgraph if layer_handler.used_bricks[brick_id].neighbouring_bricks} for subgraph in disconnected_subgraphs]
+    disconnected_subgraphs = [subgraph for subgraph in disconnected_subgraphs if subgraph]
+
+    while True:
+        disconnected_brick_id, disconnected_subgraph = select_disconnected_brick(disconnected_subgraphs)
+
+        if disconnected_brick_id is None:
+            return repair_pairs
+
+        # every subgraph gets at most one repair per round
+        disconnected_subgraphs.remove(disconnected_subgraph)
+        lowest_neighboring_brick_id = select_neighboring_brick(disconnected_brick_id, same_bricks_counter)
+
+        if lowest_neighboring_brick_id is None or lowest_neighboring_brick_id in repaired_bricks or disconnected_brick_id in repaired_bricks:
+            continue
+
+        repair_region = calculate_repair_region((disconnected_brick_id, lowest_neighboring_brick_id))
+
+        if any(HelperFunctions.regions_overlap(repair_region, other_region) for other_region in repair_regions):
+            continue
+
+        repair_pairs.append((disconnected_brick_id, lowest_neighboring_brick_id))
+        repair_regions.append(repair_region)
+        repaired_bricks.update((disconnected_brick_id, lowest_neighboring_brick_id))
+
+# replaces the disconnected brick and its neighbour with a brick that connects their subgraphs and refills the rest of their space
+def repair_brick_pair(disconnected_brick_id, lowest_neighboring_brick_id):
+    # check what type of a component the brick represents
+    disconnected_brick_indices = layer_handler.brick_voxel_indices(disconnected_brick_id)
+    neighboring_brick_indices = layer_handler.brick_voxel_indices(lowest_neighboring_brick_id)
+
+    # check what component the disconnected bricks represent
+    component1 = Components(layer_handler.components_grid[disconnected_brick_indices[0][0],
+                                            disconnected_brick_indices[0][1],
+                                            disconnected_brick_indices[0][2]])
+    
+    component2 = Components(layer_handler.components_grid[neighboring_brick_indices[0][0],
+                                            neighboring_brick_indices[0][1],
+                                            neighboring_brick_indices[0][2]])
+    
+    # determine the material of the newly spawned bricks depending on the component type
+    if component1 in [Components.light_front_left, Components.light_front_right] or component2 in [Components.light_front_left, Components.light_front_right]:
+        material = materials["matte_yellow"]
+    elif component1 in [Components.light_rear_left, Components.light_rear_right] or component2 in [Components.light_rear_left, Components.light_rear_right]:
+        material = materials["matte_red"]
+    else:
+        material = main_model_material
+
+    layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks.discard(lowest_neighboring_brick_id)
+
+    # get the subgrid of all the voxels of the two bricks that meet the criteria for connecting the two subgraphs
+    brick_ids_subgrid, empty_subgrid, subgrid_start = HelperFunctions.find_connection_points(disconnected_brick_id, lowest_neighboring_brick_id, layer_handler)
+
+    # only the box around the removed bricks has to be refilled
+    refill_region = calculate_repair_region((disconnected_brick_id, lowest_neighboring_brick_id))
+
+    # mark the voxels for the voxel_grid and the indices for the used_bricks_grid empty
+    for removed_brick_id in (disconnected_brick_id, lowest_neighboring_brick_id):
+        for x, y, z in layer_handler.remove_brick_voxels(removed_brick_id):
+            layer_handler.update_voxel_grid_index(x, y, z, False)
+
+        layer_handler.connectivity.remove_brick(removed_brick_id)
+
+    # remove all connection/neighbouring references of the removed bricks in the used_bricks dictionary
+    for brick in layer_handler.used_bricks.values():
+        brick.connected_bricks.discard(disconnected_brick_id)
+        brick.connected_bricks.discard(lowest_neighboring_brick_id)
+        brick.neighbouring_bricks.discard(disconnected_brick_id)
+        brick.neighbouring_bricks.discard(lowest_neighboring_brick_id)
+
+    # remove the selected bricks from the scene
+    layer_handler.used_bricks[disconnected_brick_id].remove_brick()
+    layer_handler.used_bricks[lowest_neighboring_brick_id].remove_brick()
+    
+    # remove the selected bricks from the used_bricks dictionary
+    del layer_handler.used_bricks[disconnected_brick_id] 
+    del layer_handler.used_bricks[lowest_neighboring_brick_id]
+	
+    # place a brick to connect the two subgraphs
+    connect_subgraphs(brick_ids_subgrid, empty_subgrid, subgrid_start)
+
+    fill_model_with_bricks(BrickType.THICK, material, region=refill_region)
+    fill_model_with_bricks(BrickType.THIN, material, region=refill_region)
+
 # connects all unconnected bricks with the model
 def fix_model_connectivity():
     connection_counter = 0
@@ -620,7 +844,7 @@ def fix_model_connectivity():
 
     while (True):
         # find and divide all the subgraphs to the main (largest) one and the smaller disconnected ones (smaller ones)
-        connection_subgraphs = HelperFunctions.find_brick_connection_subgraphs(layer_handler.used_bricks)
+        connection_subgraphs = layer_handler.connectivity.components()
 
         # increment counter if the no subgraphs were connected in the previous run
         if len(previous_subgraphs) == len(connection_subgraphs) and len(connection_subgraphs) == 2:
@@ -642,206 +866,141 @@ def fix_model_connectivity():
             return
 
         largest_subgraph = max(connection_subgraphs, key=len)
-        disconnected_subgraphs = [subgraph for subgraph in connection_subgraphs if subgraph != largest_subgraph]
+        disconnected_subgraphs = [subgraph for subgraph in connection_subgraphs if subgraph is not largest_subgraph]
+
+        # the subgraphs on detached voxel islands are left as they are
+        disconnected_subgraphs = [subgraph for subgraph in disconnected_subgraphs if not on_detached_island(subgraph)]
+
+        if not disconnected_subgraphs:
+            print("All bricks are now connected (except the ones on detached voxel islands).")
+            return
 
         if len(disconnected_subgraphs) == previous_subgraphs_counter or previous_subgraphs_counter == 0:
             same_bricks_counter += 1
 
-        disconnected_brick_id = None
+        if batch_connectivity_repair:
+            # repair a pair of every disconnected subgraph at once
+            repair_pairs = select_repair_pairs(disconnected_subgraphs, same_bricks_counter)
+        else:
+            repair_pairs = []
+            disconnected_brick_id, _ = select_disconnected_brick(disconnected_subgraphs)
 
-        while disconnected_subgraphs:
-            non_static_subgraphs = []
+            if disconnected_brick_id is not None:
+                lowest_neighboring_brick_id = select_neighboring_brick(disconnected_brick_id, same_bricks_counter)
+
+                if lowest_neighboring_brick_id is None:
+                    print(f"Brick {disconnected_brick_id} doesn't contain any non-static neighbouring bricks.")
+                    return
+
+                repair_pairs.append((disconnected_brick_id, lowest_neighboring_brick_id))
 
-            # check if all disconnected subgraphs are full of static bricks
-            for disconnected_subgraph in disconnected_subgraphs:
-                  if all(layer_handler.used_bricks[disconnected_brick_id].smooth_brick != Smooth.NONE for disconnected_brick_id in list(disconnected_subgraph)):
-                    continue
-                  else:
-                    non_static_subgraphs.append(disconnected_subgraph)
-          
-            # all subgraphs contain only static bricks -> select one of them randomly
-            if non_static_subgraphs:
-                random_subgraph = random.choice(non_static_subgraphs)
-                disconnected_brick_id = random.choice(list(random_subgraph))
-            else:
-                random_subgraph = random.choice(disconnected_subgraphs)
-                disconnected_brick_id = random.choice(list(random_subgraph))
-
-            # break if found a brick with at least one neighbour
-            if layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks:
-                break
-            # remove subgraph if no valid bricks with neighbors exist
-            else:
-                disconnected_subgraphs.remove(random_subgraph)
-                disconnected_brick_id = None
-        
         # if no brick with neighbors is found, exit the loop
-        if disconnected_brick_id == None :
+        if not repair_pairs:
             print("No remaining disconnected bricks with neighbors.")
             break
- 
-        # create a list of all neighbours and their lowest z values
-        neighbour_z_list = list()
-        
-        # if all neighbouring bricks are static, pick one randomly
-        if all(layer_handler.used_bricks[neighboring_brick].smooth_brick != Smooth.NONE for neighboring_brick in layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks):
-            neighboring_smooth_bricks = list(neighboring_brick for neighboring_brick
-                                            in layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks 
-                                            if layer_handler.used_bricks[neighboring_brick].smooth_brick == Smooth.NORMAL)
-            
-            if neighboring_smooth_bricks:
-                random_neighbouring_brick = random.choice(neighboring_smooth_bricks)
-            else:
-                random_neighbouring_brick = random.choice(list(layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks))
-
-            random_neighboring_brick_indices = np.argwhere(layer_handler.used_bricks_grid == random_neighbouring_brick)
-            lowest_z = min(z[2] for z in random_neighboring_brick_indices)
-            neighbour_z_list.append((random_neighbouring_brick, lowest_z))
-        else:
-            for neighboring_brick in layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks:
-                # ignore the static bricks (for components)
-                if layer_handler.used_bricks[neighboring_brick].smooth_brick != Smooth.NONE and same_bricks_counter < 100:
-                    continue
 
-                neighboring_brick_indices = np.argwhere(layer_handler.used_bricks_grid == neighboring_brick)
+        for disconnected_brick_id, lowest_neighboring_brick_id in repair_pairs:
+            repair_brick_pair(disconnected_brick_id, lowest_neighboring_brick_id)
 
-                if neighboring_brick_indices.size == 0:
-                    print("Problematic neighbouring brick ID:" + str(neighboring_brick))
-                    print("Problematic neighbouring brick indices:" + str(neighboring_brick_indices))
-                    break
+# removes the detached voxel islands smaller than the minimum size (no brick can ever connect them to the model)
+# returns the island of every voxel and the island of the model (the largest one)
+def remove_voxel_islands(minimum_size):
+    island_grid, island_sizes = HelperFunctions.label_voxel_islands(layer_handler.voxel_grid, layer_handler.components_grid)
+    main_island = int(np.argmax(island_sizes))
 
-                lowest_z = min(z[2] for z in neighboring_brick_indices)
+    detached_islands = np.flatnonzero(island_sizes)
+    detached_islands = detached_islands[detached_islands != main_island]
+    removed_islands = detached_islands[island_sizes[detached_islands] < minimum_size]
 
-                neighbour_z_list.append((neighboring_brick, lowest_z))
-         
-        if len(neighbour_z_list) == 0:
-            print(f"Brick {brick.id} doesn't contain any non-static neighbouring bricks.")
-            return
-        
-        # find a random neighbour with the lowest z
-        lowest_z = min(neighbour_z_list, key=lambda x: x[1])[1]
-        lowest_neighboring_brick_id = random.choice([brick_id for brick_id, z in neighbour_z_list if z == lowest_z])
-
-        # check what type of a component the brick represents
-        disconnected_brick_indices = np.argwhere(layer_handler.used_bricks_grid == disconnected_brick_id)
-        neighboring_brick_indices = np.argwhere(layer_handler.used_bricks_grid == lowest_neighboring_brick_id)
-
-        # check what component the disconnected bricks represent
-        component1 = Components(layer_handler.components_grid[disconnected_brick_indices[0][0],
-                                                disconnected_brick_indices[0][1],
-                                                disconnected_brick_indices[0][2]])
-        
-        component2 = Components(layer_handler.components_grid[neighboring_brick_indices[0][0],
-                                                neighboring_brick_indices[0][1],
-                                                neighboring_brick_indices[0][2]])
-        
-        # determine the material of the newly spawned bricks depending on the component type
-        if component1 in [Components.light_front_left, Components.light_front_right] or component2 in [Components.light_front_left, Components.light_front_right]:
-            material = materials["matte_yellow"]
-        elif component1 in [Components.light_rear_left, Components.light_rear_right] or component2 in [Components.light_rear_left, Components.light_rear_right]:
-            material = materials["matte_red"]
-        else:
-            material = main_model_material
+    print(f"Detached voxel islands: {len(detached_islands)} (sizes: {island_sizes[detached_islands].tolist()}), removed: {len(removed_islands)}")
 
-        layer_handler.used_bricks[disconnected_brick_id].neighbouring_bricks.discard(lowest_neighboring_brick_id)
+    # only the voxels that still need a brick are removed (the component voxels stay)
+    if len(removed_islands) > 0:
+        removed_voxels = np.isin(island_grid, removed_islands) & (layer_handler.voxel_grid == 1)
+        layer_handler.update_voxel_grid_layer(np.where(removed_voxels, 0, layer_handler.voxel_grid), 0)
 
-        # get the subgrid of all the voxels of the two bricks that meet the criteria for connecting the two subgraphs
-        neighbouring_bricks_subgrid, empty_subgrid, mapping_subgrid = HelperFunctions.find_connection_points(disconnected_brick_id, lowest_neighboring_brick_id, layer_handler.used_bricks_grid)
+    return island_grid, main_island
 
-        # mark the voxels for the voxel_grid and the indices for the used_bricks_grid empty
-        disconnected_brick_indices = np.where(layer_handler.used_bricks_grid == disconnected_brick_id)
+# takes the interior of the model out of the voxel_grid so only the shell gets bricks (the interior is filled with the biggest
+# plates first for InteriorFill.PLATES), the bricks connect through the shell, so the model isn't hollowed if the shell splits it
+def hollow_model_interior(fill, thickness):
+    model_voxels = (layer_handler.voxel_grid == 1) | voxel_mask(layer_handler.components_grid, lambda components: components != 0)
+    interior = HelperFunctions.interior_voxels(model_voxels, thickness) & (layer_handler.voxel_grid == 1)
 
-        for layer in range(len(disconnected_brick_indices[0])):
-            x = disconnected_brick_indices[0][layer]
-            y = disconnected_brick_indices[1][layer]
-            z = disconnected_brick_indices[2][layer]
+    _, model_island_sizes = HelperFunctions.label_voxel_islands(layer_handler.voxel_grid, layer_handler.components_grid)
+    _, shell_island_sizes = HelperFunctions.label_voxel_islands(np.where(interior, 0, layer_handler.voxel_grid), layer_handler.components_grid)
 
-            layer_handler.voxel_grid[x, y, z] = 1
-            layer_handler.used_bricks_grid[x, y, z] = 0
-        
-        used_bricks_grid = layer_handler.used_bricks_grid
-        neighbouring_brick_indices = np.where(used_bricks_grid == lowest_neighboring_brick_id)
-
-        for layer in range(len(neighbouring_brick_indices[0])):
-            x = neighbouring_brick_indices[0][layer]
-            y = neighbouring_brick_indices[1][layer]
-            z = neighbouring_brick_indices[2][layer]
-
-            layer_handler.voxel_grid[x, y, z] = 1
-            layer_handler.used_bricks_grid[x, y, z] = 0
-
-        # remove all connection/neighbouring references of the removed bricks in the used_bricks dictionary
-        for brick in layer_handler.used_bricks.values():
-            brick.connected_bricks.discard(disconnected_brick_id)
-            brick.connected_bricks.discard(lowest_neighboring_brick_id)
-            brick.neighbouring_bricks.discard(disconnected_brick_id)
-            brick.neighbouring_bricks.discard(lowest_neighboring_brick_id)
-
-        # remove the selected bricks from the scene
-        layer_handler.used_bricks[disconnected_brick_id].remove_brick()
-        layer_handler.used_bricks[lowest_neighboring_brick_id].remove_brick()
-        
-        # remove the selected bricks from the used_bricks dictionary
-        del layer_handler.used_bricks[disconnected_brick_id] 
-        del layer_handler.used_bricks[lowest_neighboring_brick_id]
-    	
-        # place a brick to connect the two subgraphs
-        connect_subgraphs(neighbouring_bricks_subgrid, empty_subgrid, mapping_subgrid)
+    if np.count_nonzero(shell_island_sizes) > np.count_nonzero(model_island_sizes):
+        print("Error: The shell splits the model into more islands, the interior is not hollowed.")
+        return
+
+    shell = (layer_handler.voxel_grid == 1) & ~interior
 
-        fill_model_with_bricks(BrickType.THICK, material)
-        fill_model_with_bricks(BrickType.THIN, material)
+    if fill == InteriorFill.PLATES:
+        # only the interior is left in the voxel_grid while the plates are placed
+        layer_handler.update_voxel_grid_layer(np.where(shell, 0, layer_handler.voxel_grid), 0)
+
+        plate_catalog = BrickCatalog({name: brick for name, brick in thin_bricks.items() if brick.length * brick.width >= interior_plate_area})
+        fill_model_with_bricks(BrickType.THIN, catalog=plate_catalog)
+
+    empty_voxels = np.count_nonzero(interior & (layer_handler.voxel_grid == 1))
+    layer_handler.update_voxel_grid_layer(shell.astype(occupancy_dtype), 0)
+
+    print(f"Interior voxels: {np.count_nonzero(interior)}, left empty: {empty_voxels}, shell voxels: {np.count_nonzero(shell)}")
+
+# returns whether the subgraph lies on a detached voxel island (it can never be connected to the model)
+def on_detached_island(subgraph):
+    brick_voxels = layer_handler.brick_voxel_indices(next(iter(subgraph)))
+
+    if len(brick_voxels) == 0:
+        return False
+
+    brick_island = island_grid[tuple(brick_voxels[0])]
+
+    return brick_island != 0 and brick_island != main_island
 
 # returns a list of available spawns for each brick
 def find_allowed_spawns(fitting_positions, brick):
-    def check_above_voxels(x_pos, y_pos, z_pos):
-        kernel = brick.brick_kernel
-        
-        for x in range(kernel.shape[0]):
-            for y in range(kernel.shape[1]):
-                highest_z = None
-
-                # find the highest voxel for a specific XY in the kernel (start from highest and go to lowest)
-                for z in range(kernel.shape[2] - 1, -1, -1):
-                    if kernel[x, y, z] == 1:
-                        highest_z = z
-                        break
-                        
-                # if a voxel exists, check if the voxel above it is empty space (out of the model -
-                #  that means the looked at voxel is the highest voxel in the actual model for that (x, y))
-                if highest_z is not None:
-                    global_x = x_pos + x
-                    global_y = y_pos + y
-                    global_z = z_pos + highest_z
-
-                    if (0 <= global_x < original_voxel_grid.shape[0] and
-                    0 <= global_y < original_voxel_grid.shape[1] and
-                    0 <= global_z + 1 < original_voxel_grid.shape[2]):
-                        # check if there are empty brick voxels anywhere above the highest Z for each XY - (sloped) brick cannot be placed there
-                        for above_z in range(global_z + 1, original_voxel_grid.shape[2]):
-                            if original_voxel_grid[global_x, global_y, above_z] == 1:
-                                return False
-       
-        return True
-    
-    potential_spawns = set()
+    fitting_positions = np.asarray(fitting_positions).reshape(-1, 3)
 
-    for position in fitting_positions:
-        x, y, z = (pos.item() for pos in position)
-        
-        # add the position to the list of potential positions if the voxel above is empty
-        if check_above_voxels(x, y, z):
-            potential_spawns.add(tuple(position))
+    # global indices of the highest brick voxel in each (x, y) column of the brick for every position
+    column_xs, column_ys, column_top_zs = brick.top_profile
+    global_xs = fitting_positions[:, 0, np.newaxis] + column_xs
+    global_ys = fitting_positions[:, 1, np.newaxis] + column_ys
+    global_zs = fitting_positions[:, 2, np.newaxis] + column_top_zs
+
+    # only the columns with voxels above them (inside the model) are checked
+    checked_columns = ((global_xs >= 0) & (global_xs < original_voxel_grid.shape[0]) &
+                       (global_ys >= 0) & (global_ys < original_voxel_grid.shape[1]) &
+                       (global_zs + 1 >= 0) & (global_zs + 1 < original_voxel_grid.shape[2]))
+
+    # (sloped) brick cannot be placed where a filled voxel of the model is above its highest voxel in any column
+    highest_zs = original_height_map[np.clip(global_xs, 0, original_voxel_grid.shape[0] - 1), np.clip(global_ys, 0, original_voxel_grid.shape[1] - 1)]
+    blocked_positions = (checked_columns & (highest_zs > global_zs)).any(axis=1)
+
+    potential_spawns = set(tuple(position) for position in fitting_positions[~blocked_positions])
 
     return list(potential_spawns)
 
 
-# fill the model with bricks and print the times of each stage
+# remove the small voxel islands, fill the model with bricks and print the times of each stage
+start_temp = time.time()
+island_grid, main_island = remove_voxel_islands(minimum_island_size)
+islands_time = time.time() - start_temp
+
+start_temp = time.time()
+
+if interior_fill != InteriorFill.SOLID:
+    hollow_model_interior(interior_fill, shell_thickness)
+
+hollowing_time = time.time() - start_temp
+
 start_temp = time.time()
-fill_with_bricks_sloped(sloped_bricks)
+fill_with_bricks_sloped(sloped_catalog)
 sloped_time = time.time() - start_temp
 
 start_temp = time.time()
-fill_model_with_bricks_smooth(smooth_bricks)
+fill_model_with_bricks_smooth(smooth_catalog)
 smooth_time = time.time() - start_temp
 
 start_temp = time.time()
@@ -867,6 +1026,8 @@ full_time = time.time() - start
 print(f"Component mapping time: {mapping_time:.3f} seconds")
 print(f"Wheels generation: {wheels_time:.3f} seconds")
 print(f"Cabin generation: {cabin_time:.3f} seconds")
+print(f"Voxel islands removal: {islands_time:.3f} seconds")
+print(f"Interior hollowing: {hollowing_time:.3f} seconds")
 print(f"Sloped bricks generation: {sloped_time:.3f} seconds")
 print(f"Smooth bricks generation: {smooth_time:.3f} seconds")
 print(f"Thick bricks generation: {thick_time:.3f} seconds.")
@@ -875,6 +1036,9 @@ print(f"Lights generation: {lights_time:.3f} seconds.")
 print(f"Fixing connectivity: {connectivity_time:.3f} seconds.")
 print(f"Full generation: {full_time:.3f} seconds.")
 
+# write the file-backed grids to their files
+layer_handler.flush_grids()
+
 # reset the brick ID and clear all invisible (temporary) bricks from the scene
 Brick.id = 0
 
@@ -111,27 +111,22 @@ class Binvox(object):
 
         values, counts = raw_data[::2], raw_data[1::2]
 
-        sz = np.prod(dims)
-        index, end_index = 0, 0
-        end_indices = np.cumsum(counts)
-        indices = np.concatenate(([0], end_indices[:-1])).astype(end_indices.dtype)
+        end_indices = np.cumsum(counts, dtype=np.int64)
+        indices = end_indices - counts
 
-        values = values.astype(np.bool)
+        values = values.astype(np.bool_)
         indices = indices[values]
-        end_indices = end_indices[values]
-
-        nz_voxels = []
-        for index, end_index in zip(indices, end_indices):
-            nz_voxels.extend(range(index, end_index))
-        nz_voxels = np.array(nz_voxels)
-        # TODO are these dims correct?
-        # according to docs,
-        # index = x * wxh + z * width + y; // wxh = width * height = d * d
-
-        x = nz_voxels / (dims[0]*dims[1])
-        zwpy = nz_voxels % (dims[0]*dims[1]) # z*w + y
-        z = zwpy / dims[0]
-        y = zwpy % dims[0]
+        counts = counts[values].astype(np.int64)
+
+        # expand the runs: every voxel is the start of its run plus its
+        # position in the run
+        run_offsets = indices - (np.cumsum(counts) - counts)
+        nz_voxels = np.arange(counts.sum(), dtype=np.int64) + np.repeat(run_offsets, counts)
+
+        # the raw data is indexed as [x, z, y] with dims in the same order:
+        # index = x * (dims[1] * dims[2]) + z * dims[2] + y
+        x, zwpy = np.divmod(nz_voxels, dims[1]*dims[2]) # z*w + y
+        z, y = np.divmod(zwpy, dims[2])
         if fix_coords:
             data = np.vstack((x, y, z))
             axis_order = 'xyz'
@@ -172,11 +167,9 @@ class Binvox(object):
             else:
                 raise NotImplementedError('Unsupported voxel model axis order')
 
-            # keep a sort of state machine for writing run length encoding
+            # run length encoding as (state, counter) bytes
             voxels_compressed = compress_flat_voxels(voxels_flat)
-            BYTE_SIZE = 1
-            for entry in voxels_compressed:
-                fp.write(entry.to_bytes(BYTE_SIZE, 'big'))
+            fp.write(voxels_compressed.tobytes())
 
     def __copy__(self):
         data        = self.data.copy()
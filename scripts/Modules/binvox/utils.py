@@ -1,24 +1,21 @@
 
+import numpy as np
+
+
 def compress_flat_voxels(voxels_flat):
-    # keep a sort of state machine for writing run length encoding
-    state = voxels_flat[0]
-    counter = 0
-    compressed = []
+    # returns the run length encoding as (state, counter) bytes
+    voxels_flat = np.asarray(voxels_flat).ravel()
+    if voxels_flat.size == 0:
+        return np.empty(0, dtype=np.uint8)
+
+    # a run starts wherever the state changes
+    run_starts = np.concatenate(([0], np.flatnonzero(voxels_flat[1:] != voxels_flat[:-1]) + 1))
+    run_lengths = np.diff(np.append(run_starts, voxels_flat.size))
 
-    for c in voxels_flat:
-        if c == state:
-            counter += 1
-            # if counter hits max, dump
-            if counter == 255:
-                compressed += [int(state), counter]
-                counter = 0
-        else:
-            # if switch state, dump
-            compressed += [int(state), counter]
-            state = c
-            counter = 1
-    # flush out remainders
-    if counter > 0:
-        compressed += [int(state), counter]
+    # split the runs into counters of at most 255 (only the last counter of a run is smaller)
+    counters_per_run = (run_lengths + 254) // 255
+    counters = np.full(counters_per_run.sum(), 255, dtype=np.int64)
+    counters[np.cumsum(counters_per_run) - 1] = run_lengths - (counters_per_run - 1) * 255
+    states = np.repeat(voxels_flat[run_starts], counters_per_run)
 
-    return compressed
+    return np.stack((states, counters), axis=1).astype(np.uint8).ravel()
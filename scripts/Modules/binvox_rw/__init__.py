@@ -3,6 +3,7 @@
 from .binvox_rw import Voxels
 from .binvox_rw import read_header
 from .binvox_rw import read_as_3d_array
+from .binvox_rw import read_as_working_array
 from .binvox_rw import read_as_coord_array
 from .binvox_rw import dense_to_sparse
 from .binvox_rw import sparse_to_dense
@@ -60,6 +60,9 @@ True
 
 import numpy as np
 
+# voxels decoded at once by read_as_working_array
+BLOCK_VOXELS = 1 << 21
+
 class Voxels(object):
     """ Holds a binvox model.
     data is either a three-dimensional numpy boolean array (dense representation)
@@ -87,7 +90,7 @@ class Voxels(object):
         self.dims = dims
         self.translate = translate
         self.scale = scale
-        assert (axis_order in ('xzy', 'xyz'))
+        assert (sorted(axis_order) == ['x', 'y', 'z'])
         self.axis_order = axis_order
 
     def clone(self):
@@ -147,6 +150,61 @@ def read_as_3d_array(fp, fix_coords=True):
         axis_order = 'xzy'
     return Voxels(data, dims, translate, scale, axis_order)
 
+def read_as_working_array(source, dtype=np.bool_, axes=(0, 1, 2), fix_coords=True):
+    """ Read binary binvox format straight into a C-contiguous array.
+
+    Same as read_as_3d_array(fp, fix_coords).data transposed by axes and
+    converted to dtype, but the runs are decoded slab by slab into the
+    final array, so the only full size allocation is the result.
+
+    source is a file object or a path. A path is memory-mapped, so the
+    run-length data isn't read into memory as a whole either.
+
+    The axis_order of the model follows axes, e.g. axes=(2, 1, 0) with
+    fix_coords gives 'zyx' (data[z, y, x]).
+    """
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        with open(source, 'rb') as fp:
+            dims, translate, scale = read_header(fp)
+            offset = fp.tell()
+        raw_data = np.memmap(source, dtype=np.uint8, mode='r', offset=offset)
+    else:
+        dims, translate, scale = read_header(source)
+        raw_data = np.frombuffer(source.read(), dtype=np.uint8)
+
+    # the raw data is indexed as [x, z, y], raw_axes maps the axes of the
+    # result to the raw axes
+    stored_order = 'xyz' if fix_coords else 'xzy'
+    raw_axes = [(0, 2, 1)[axis] for axis in axes] if fix_coords else list(axes)
+    data = np.zeros([dims[axis] for axis in raw_axes], dtype=dtype)
+    raw_view = np.transpose(data, np.argsort(raw_axes))
+
+    values, counts = raw_data[::2], raw_data[1::2]
+    end_indices = np.cumsum(counts, dtype=np.int64)
+    start_indices = end_indices - counts
+
+    # decode the runs overlapping every block of x slabs of the raw data
+    # (blocks of several slabs keep the writes into a transposed result
+    # mostly sequential)
+    slab_size = dims[1] * dims[2]
+    block_slabs = max(1, BLOCK_VOXELS // max(slab_size, 1))
+
+    for block_x in range(0, dims[0], block_slabs):
+        block_end_x = min(block_x + block_slabs, dims[0])
+        block_start, block_end = block_x * slab_size, block_end_x * slab_size
+        first_run = np.searchsorted(end_indices, block_start, side='right')
+        last_run = np.searchsorted(start_indices, block_end, side='left')
+        run_values = values[first_run:last_run]
+        if not run_values.any():
+            continue
+        run_starts = np.maximum(start_indices[first_run:last_run], block_start)
+        run_ends = np.minimum(end_indices[first_run:last_run], block_end)
+        block = np.repeat(run_values, run_ends - run_starts)
+        raw_view[block_x:block_end_x] = block.reshape(-1, dims[1], dims[2])
+
+    axis_order = ''.join(stored_order[axis] for axis in axes)
+    return Voxels(data, dims, translate, scale, axis_order)
+
 def read_as_coord_array(fp, fix_coords=True):
     """ Read binary binvox format as coordinates.
 
@@ -166,27 +224,22 @@ def read_as_coord_array(fp, fix_coords=True):
 
     values, counts = raw_data[::2], raw_data[1::2]
 
-    sz = np.prod(dims)
-    index, end_index = 0, 0
-    end_indices = np.cumsum(counts)
-    indices = np.concatenate(([0], end_indices[:-1])).astype(end_indices.dtype)
+    end_indices = np.cumsum(counts, dtype=np.int64)
+    indices = end_indices - counts
 
     values = values.astype(np.bool_)
     indices = indices[values]
-    end_indices = end_indices[values]
-
-    nz_voxels = []
-    for index, end_index in zip(indices, end_indices):
-        nz_voxels.extend(range(index, end_index))
-    nz_voxels = np.array(nz_voxels)
-    # TODO are these dims correct?
-    # according to docs,
-    # index = x * wxh + z * width + y; // wxh = width * height = d * d
-
-    x = nz_voxels / (dims[0]*dims[1])
-    zwpy = nz_voxels % (dims[0]*dims[1]) # z*w + y
-    z = zwpy / dims[0]
-    y = zwpy % dims[0]
+    counts = counts[values].astype(np.int64)
+
+    # expand the runs: every voxel is the start of its run plus its
+    # position in the run
+    run_offsets = indices - (np.cumsum(counts) - counts)
+    nz_voxels = np.arange(counts.sum(), dtype=np.int64) + np.repeat(run_offsets, counts)
+
+    # the raw data is indexed as [x, z, y] with dims in the same order:
+    # index = x * (dims[1] * dims[2]) + z * dims[2] + y
+    x, zwpy = np.divmod(nz_voxels, dims[1]*dims[2]) # z*w + y
+    z, y = np.divmod(zwpy, dims[2])
     if fix_coords:
         data = np.vstack((x, y, z))
         axis_order = 'xyz'
@@ -226,6 +279,28 @@ def sparse_to_dense(voxel_data, dims, dtype=np.bool_):
     #"""
     #return x*(dims[1]*dims[2]) + z*dims[1] + y
 
+def compress_flat_voxels(voxels_flat):
+    """ Run-length encode flat voxel data as binvox (value, count) bytes.
+
+    Runs longer than 255 voxels are split into several entries.
+    """
+    voxels_flat = np.asarray(voxels_flat).ravel()
+    if voxels_flat.size == 0:
+        return np.empty(0, dtype=np.uint8)
+
+    # a run starts wherever the value changes
+    run_starts = np.concatenate(([0], np.flatnonzero(voxels_flat[1:] != voxels_flat[:-1]) + 1))
+    run_lengths = np.diff(np.append(run_starts, voxels_flat.size))
+
+    # split the runs into entries of at most 255 voxels (only the last
+    # entry of a run is shorter)
+    entries = (run_lengths + 254) // 255
+    counts = np.full(entries.sum(), 255, dtype=np.int64)
+    counts[np.cumsum(entries) - 1] = run_lengths - (entries - 1) * 255
+    states = np.repeat(voxels_flat[run_starts], entries)
+
+    return np.stack((states, counts), axis=1).astype(np.uint8).ravel()
+
 def write(voxel_model, fp):
     """ Write binary binvox format.
 
@@ -241,11 +316,11 @@ def write(voxel_model, fp):
     else:
         dense_voxel_data = voxel_model.data
 
-    fp.write('#binvox 1\n')
-    fp.write('dim '+' '.join(map(str, voxel_model.dims))+'\n')
-    fp.write('translate '+' '.join(map(str, voxel_model.translate))+'\n')
-    fp.write('scale '+str(voxel_model.scale)+'\n')
-    fp.write('data\n')
+    fp.write(b'#binvox 1\n')
+    fp.write(('dim '+' '.join(map(str, voxel_model.dims))+'\n').encode())
+    fp.write(('translate '+' '.join(map(str, voxel_model.translate))+'\n').encode())
+    fp.write(('scale '+str(voxel_model.scale)+'\n').encode())
+    fp.write(b'data\n')
     if not voxel_model.axis_order in ('xzy', 'xyz'):
         raise ValueError('Unsupported voxel model axis order')
 
@@ -254,27 +329,7 @@ def write(voxel_model, fp):
     elif voxel_model.axis_order=='xyz':
         voxels_flat = np.transpose(dense_voxel_data, (0, 2, 1)).flatten()
 
-    # keep a sort of state machine for writing run length encoding
-    state = voxels_flat[0]
-    ctr = 0
-    for c in voxels_flat:
-        if c==state:
-            ctr += 1
-            # if ctr hits max, dump
-            if ctr==255:
-                fp.write(chr(state))
-                fp.write(chr(ctr))
-                ctr = 0
-        else:
-            # if switch state, dump
-            fp.write(chr(state))
-            fp.write(chr(ctr))
-            state = c
-            ctr = 1
-    # flush out remainders
-    if ctr > 0:
-        fp.write(chr(state))
-        fp.write(chr(ctr))
+    fp.write(compress_flat_voxels(voxels_flat).tobytes())
 
 if __name__ == '__main__':
     import doctest
@@ -0,0 +1,82 @@
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, get_all_start_methods
+from FitEngine import FitMap, FitBackend, pack_voxel_grid, convolution_as_correlation, find_mirrored_positions, select_non_overlapping
+
+# a layer (slab) of the voxel_grid filled by one worker with the brick kernels in their order of priority
+SlabFill = namedtuple("SlabFill", ["z_start", "z_end", "kernels", "kernel_origins", "seed"])
+
+# voxel_grid shared by all the workers of the pool (every worker only writes into its own slabs)
+shared_voxel_grid = None
+
+# attaches the worker process to the shared voxel_grid
+def attach_shared_voxel_grid(shared_buffer, grid_shape, grid_dtype):
+    global shared_voxel_grid
+    shared_voxel_grid = np.frombuffer(shared_buffer, dtype=grid_dtype).reshape(grid_shape, order='F')
+
+# fills a layer with the rectangular brick kernels (same rules as fill_with_bricks) and returns the placements
+# each placement is (kernel index, x, y, z) in the indices of the layer, rng is a numpy Generator (it shuffles the rows of
+# the fitting positions array without duplicating them)
+def fill_layer(voxel_grid_layer, kernels, kernel_origins, rng, backend=FitBackend.CORRELATION, batch_placement=False, coarse_to_fine=False):
+    packed_grid = pack_voxel_grid(voxel_grid_layer) if backend == FitBackend.BIT_PACKED else None
+    fit_map = FitMap(voxel_grid_layer, 0, backend, packed_grid, coarse_to_fine=coarse_to_fine)
+    placements = []
+
+    for kernel_index, (kernel, kernel_origin) in enumerate(zip(kernels, kernel_origins)):
+        # the bricks are placed with the convolution (same positions as the correlation with the flipped kernel)
+        correlation_kernel, correlation_origin = convolution_as_correlation(kernel, kernel_origin)
+
+        while True:
+            fitting_positions = np.argwhere(fit_map.get_fit_grid(correlation_kernel, correlation_origin))
+            rng.shuffle(fitting_positions)
+
+            # no fitting positions found, try the next kernel
+            if len(fitting_positions) == 0:
+                break
+
+            if batch_placement:
+                positions = select_non_overlapping(fitting_positions, kernel, voxel_grid_layer.shape, True)
+            else:
+                # place a mirrored pair if there is one, otherwise a random position
+                positions = find_mirrored_positions(fitting_positions, voxel_grid_layer.shape, kernel.shape[0])
+
+                if not positions:
+                    positions = [tuple(index.item() for index in rng.choice(fitting_positions, axis=0))]
+
+            # mark the voxels of the placed bricks as filled
+            for x_pos, y_pos, z_pos in positions:
+                voxel_grid_layer[x_pos:x_pos + kernel.shape[0], y_pos:y_pos + kernel.shape[1], z_pos:z_pos + kernel.shape[2]] = 0
+
+                if packed_grid is not None:
+                    packed_grid.set_box(x_pos, y_pos, z_pos, kernel.shape, 0)
+
+                fit_map.mark_dirty(x_pos, y_pos, z_pos, kernel.shape)
+                placements.append((kernel_index, x_pos, y_pos, z_pos))
+
+    return np.array(placements, dtype=np.int32).reshape(-1, 4)
+
+# fills a slab of the shared voxel_grid (runs in a worker process) and returns the placements in global indices
+def fill_slab(slab, backend, batch_placement, coarse_to_fine):
+    voxel_grid_layer = shared_voxel_grid[:, :, slab.z_start:slab.z_end]
+    placements = fill_layer(voxel_grid_layer, slab.kernels, slab.kernel_origins, np.random.default_rng(slab.seed), backend, batch_placement, coarse_to_fine)
+    placements[:, 3] += slab.z_start
+
+    return placements
+
+# fills all the slabs in a process pool and returns the filled voxel_grid with the placements of each slab
+# the slabs cannot overlap (every slab only reads and writes its own layers of the voxel_grid)
+def fill_layers(voxel_grid, slabs, backend=FitBackend.CORRELATION, batch_placement=False, workers=None, coarse_to_fine=False):
+    # fork shares the loaded modules with the workers (spawn needs sys.executable to be a python interpreter)
+    context = get_context("fork" if "fork" in get_all_start_methods() else "spawn")
+
+    # copy the voxel_grid into shared memory the workers write the filled slabs into (every slab is a block of the buffer)
+    shared_buffer = context.RawArray("b", voxel_grid.nbytes)
+    filled_voxel_grid = np.frombuffer(shared_buffer, dtype=voxel_grid.dtype).reshape(voxel_grid.shape, order='F')
+    filled_voxel_grid[:] = voxel_grid
+
+    with ProcessPoolExecutor(workers, context, attach_shared_voxel_grid, (shared_buffer, voxel_grid.shape, voxel_grid.dtype)) as executor:
+        futures = [executor.submit(fill_slab, slab, backend, batch_placement, coarse_to_fine) for slab in slabs]
+        slab_placements = [future.result() for future in futures]
+
+    return filled_voxel_grid.copy(order='F'), slab_placements
@@ -0,0 +1,112 @@
+import numpy as np
+
+# size of a voxel in the model space (a voxel is one stud wide and one plate high)
+voxel_size = (1.0, 1.0, 0.4)
+
+# the column rays are moved slightly off the voxel centers so they never pass exactly through an edge or a vertex of the mesh
+column_jitter = (1.3e-5, 2.9e-5)
+
+# maximum number of (triangle, column) pairs tested at once
+max_column_pairs = 1 << 20
+
+# returns the shape of the grid that contains all the vertices (the grid starts at the origin)
+def mesh_grid_shape(vertices, origin=(0.0, 0.0, 0.0), size=voxel_size):
+    vertices = (np.asarray(vertices, dtype=np.float64).reshape(-1, 3) - origin) / size
+
+    return tuple(max(int(np.ceil(upper)), 1) for upper in vertices.max(axis=0))
+
+# returns the columns (x, y indices) whose ray goes through the projection of the triangles on the XY plane
+# (as the triangle index and the column indices of every pair)
+def triangle_columns(corners, grid_shape):
+    column_starts = []
+    column_ends = []
+
+    for axis in range(2):
+        # columns with the (moved) center inside the bounding box of the triangle
+        lower = np.ceil(corners[:, :, axis].min(axis=1) - 0.5 - column_jitter[axis])
+        upper = np.floor(corners[:, :, axis].max(axis=1) - 0.5 - column_jitter[axis])
+        column_starts.append(np.clip(lower, 0, grid_shape[axis]).astype(np.int64))
+        column_ends.append(np.clip(upper + 1, 0, grid_shape[axis]).astype(np.int64))
+
+    x_counts = np.maximum(column_ends[0] - column_starts[0], 0)
+    y_counts = np.maximum(column_ends[1] - column_starts[1], 0)
+    pair_counts = x_counts * y_counts
+
+    # enumerate the columns of the bounding box of every triangle
+    triangle_indices = np.repeat(np.arange(len(corners)), pair_counts)
+    local_indices = np.arange(pair_counts.sum()) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    column_xs = column_starts[0][triangle_indices] + local_indices // y_counts[triangle_indices]
+    column_ys = column_starts[1][triangle_indices] + local_indices % y_counts[triangle_indices]
+
+    return triangle_indices, column_xs, column_ys
+
+# returns the column rays that hit the triangles and the Z position of every hit (in voxels)
+def column_hits(corners, grid_shape):
+    triangle_indices, column_xs, column_ys = triangle_columns(corners, grid_shape)
+    a, b, c = (corners[triangle_indices, corner] for corner in range(3))
+
+    ray_xs = column_xs + 0.5 + column_jitter[0]
+    ray_ys = column_ys + 0.5 + column_jitter[1]
+
+    # barycentric coordinates of the ray in the projected triangle (vertical triangles can't be hit)
+    area = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1])
+    valid = area != 0
+    area = np.where(valid, area, 1)
+
+    b_weight = ((ray_xs - a[:, 0]) * (c[:, 1] - a[:, 1]) - (c[:, 0] - a[:, 0]) * (ray_ys - a[:, 1])) / area
+    c_weight = ((b[:, 0] - a[:, 0]) * (ray_ys - a[:, 1]) - (ray_xs - a[:, 0]) * (b[:, 1] - a[:, 1])) / area
+    a_weight = 1 - b_weight - c_weight
+
+    hits = valid & (a_weight >= 0) & (b_weight >= 0) & (c_weight >= 0)
+    hit_zs = a_weight * a[:, 2] + b_weight * b[:, 2] + c_weight * c[:, 2]
+
+    return column_xs[hits], column_ys[hits], hit_zs[hits]
+
+# returns the voxels of the grid inside of the closed mesh (the voxel center is inside if an odd number of surfaces is below it)
+# vertices are (n, 3) positions in the model space, triangles are (m, 3) vertex indices
+def voxelize_mesh(vertices, triangles, grid_shape, origin=(0.0, 0.0, 0.0), size=voxel_size):
+    vertices = (np.asarray(vertices, dtype=np.float64).reshape(-1, 3) - origin) / size
+    corners = vertices[np.asarray(triangles, dtype=np.int64).reshape(-1, 3)]
+
+    # number of surfaces crossed right below every voxel center of each column (one more layer for the hits above the grid)
+    # only the parity is used, so the counts can wrap around
+    crossings = np.zeros((grid_shape[0], grid_shape[1], grid_shape[2] + 1), dtype=np.uint8)
+
+    # the triangles are tested in chunks of about max_column_pairs (triangle, column) pairs (at least one triangle per chunk)
+    column_estimates = np.prod([np.ptp(corners[:, :, axis], axis=1) + 2 for axis in range(2)], axis=0)
+    cumulative_estimates = np.cumsum(column_estimates)
+    chunk_start = 0
+
+    while chunk_start < len(corners):
+        previous_estimate = cumulative_estimates[chunk_start] - column_estimates[chunk_start]
+        chunk_end = max(int(np.searchsorted(cumulative_estimates, previous_estimate + max_column_pairs, side='right')), chunk_start + 1)
+        column_xs, column_ys, hit_zs = column_hits(corners[chunk_start:chunk_end], grid_shape)
+        chunk_start = chunk_end
+
+        # the first voxel whose center is above the hit
+        voxel_zs = np.clip(np.ceil(hit_zs - 0.5), 0, grid_shape[2]).astype(np.int64)
+        np.add.at(crossings, (column_xs, column_ys, voxel_zs), 1)
+
+    return np.cumsum(crossings, axis=2, dtype=np.uint8)[:, :, :grid_shape[2]] % 2 == 1
+
+# voxelizes the model and its components in one pass (the first component that contains a voxel gets it)
+# components are (component value, vertices, triangles), returns the voxel_grid without the component voxels and the components_grid
+def voxelize_model(vertices, triangles, components, grid_shape, origin=(0.0, 0.0, 0.0), size=voxel_size):
+    component_grids = [(component_value, voxelize_mesh(component_vertices, component_triangles, grid_shape, origin, size))
+                       for component_value, component_vertices, component_triangles in components]
+
+    # the model contains its components
+    model_grid = voxelize_mesh(vertices, triangles, grid_shape, origin, size)
+
+    for _, component_grid in component_grids:
+        model_grid |= component_grid
+
+    voxel_grid = model_grid.astype(np.uint8)
+    components_grid = voxel_grid.copy()
+
+    for component_value, component_grid in component_grids:
+        component_voxels = component_grid & (voxel_grid == 1)
+        voxel_grid[component_voxels] = 0
+        components_grid[component_voxels] = component_value
+
+    return voxel_grid, components_grid